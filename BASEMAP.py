@@ -0,0 +1,8 @@
+from basemap_builder import build_all
+
+# Basemap build stage: draws coastlines/borders/states for every active region, width and style
+# that is not cached yet under Hrrr/basemaps. When nothing changed this only checks that
+# the files exist; Cartopy and Natural Earth are loaded only for missing images.
+index = build_all()
+count = sum(len(ladder) for entry in index.values() for ladder in entry["styles"].values())
+print(f"Basemaps ready: {count} images for {len(index)} regions")
@@ -0,0 +1,140 @@
+import os
+import requests
+from datetime import datetime, timedelta
+from products import PRODUCTS as ALL_PRODUCTS, evaluate_step, prerendered_products, required_inputs
+from derived_engine import (
+    BASE_URL, build_query, decode_fields, update_history, with_lagged,
+    store_inputs, with_ensemble, render_product
+)
+from cycle_store import evict, get_field, get_grid, put_grid as store_grid
+from frame_bounds import new_manifest
+from frame_bundles import build_bundle
+from field_cache import field_key, attach, attach_grid, put, put_grid, release_all, start_cycle
+from grib_lifecycle import scratch_dir, has_room, written, done, save_metrics
+
+# Directories: one output folder per pre-rendered product under Hrrr/static/derived
+PRODUCTS = prerendered_products()
+derived_dir = os.path.join("Hrrr", "static", "derived")
+# GRIBs go to the (RAM-backed when available) scratch area and are deleted once decoded
+grib_dir = scratch_dir("derived")
+
+# --- Clean up old files in every product folder ---
+for folder in [os.path.join(derived_dir, name) for name in PRODUCTS]:
+    if os.path.exists(folder):
+        for f in os.listdir(folder):
+            file_path = os.path.join(folder, f)
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+
+for name in PRODUCTS:
+    os.makedirs(os.path.join(derived_dir, name), exist_ok=True)
+
+# Get the current UTC date and time and select the most recent HRRR run (0z, 6z, 12z, 18z)
+current_utc_time = datetime.utcnow()
+run_hour = (current_utc_time.hour // 6) * 6
+if run_hour == 24:
+    run_hour = 18
+date_for_run = current_utc_time
+if current_utc_time.hour < run_hour:
+    # If current hour is less than run_hour (shouldn't happen with integer division, but safe)
+    date_for_run = current_utc_time - timedelta(hours=6)
+    run_hour = (date_for_run.hour // 6) * 6
+date_str = date_for_run.strftime("%Y%m%d")
+hour_str = str(run_hour).zfill(2)  # 00, 06, 12, 18
+cycle_id = f"{date_str}_{hour_str}z"
+cycle_start = datetime.strptime(f"{date_str}{hour_str}", "%Y%m%d%H")
+
+# Inputs of every product are decoded and stored (for on-demand rendering and /points,
+# which evaluate the rest themselves); only the pre-rendered products are drawn here
+inputs = required_inputs(ALL_PRODUCTS)
+ensemble_keys = {spec["key"] for spec in inputs if spec["ensemble"]}
+
+# Bound the cross-cycle field store before adding another cycle to it
+evict(ensemble_keys)
+# The shared field cache only ever holds the cycle being rendered
+start_cycle(cycle_id)
+manifests = {name: new_manifest(name, cycle_id) for name in PRODUCTS}
+
+# Function to download one GRIB file holding the given inputs (all that are not cached yet)
+def download_file(hour_str, step, query):
+    file_name = f"hrrr.t{hour_str}z.wrfsfcf{step:02d}.grib2"
+    file_path = os.path.join(grib_dir, file_name)
+    url = f"{BASE_URL}?dir=%2Fhrrr.{date_str}%2Fconus&file={file_name}{query}"
+    if not has_room(file_name):
+        return None
+    response = requests.get(url, stream=True)
+    if response.status_code == 200:
+        with open(file_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=1024 * 64):
+                if chunk:
+                    f.write(chunk)
+        written(file_path)
+        print(f"Downloaded {file_name}")
+        return file_path
+    else:
+        print(f"Failed to download {file_name} (Status Code: {response.status_code})")
+        return None
+
+# Main process: at most one download and one decode per step, then every product from memory
+history = {}
+for step in range(0, 49):
+    # Fields decoded earlier this cycle: from the RAM field cache (zero-copy) or, for the
+    # other render scripts' fields, from the durable cycle store
+    fields = {}
+    for spec in inputs:
+        cached = attach(field_key(cycle_id, step, spec["key"]))
+        if cached is None:
+            cached = get_field(cycle_id, spec["key"], step)
+        if cached is not None:
+            fields[spec["key"]] = cached
+    lats, lons = attach_grid()
+    if lats is None:
+        lats, lons = get_grid()
+    missing = [spec for spec in inputs if spec["key"] not in fields]
+
+    if missing or lats is None:
+        grib_file = download_file(hour_str, step, build_query(missing or inputs[:1]))
+        if not grib_file:
+            continue
+        try:
+            decoded, lats, lons = decode_fields(grib_file, missing)
+        except Exception as e:
+            print(f"Error decoding {grib_file}: {e}")
+            continue
+        finally:
+            done(grib_file)  # decoded arrays are in memory / the field cache from here on
+        put_grid(lats, lons)
+        store_grid(lats, lons)
+        for spec in missing:
+            if spec["key"] in decoded:
+                put(field_key(cycle_id, step, spec["key"]), decoded[spec["key"]])
+                fields[spec["key"]] = decoded[spec["key"]]
+    else:
+        print(f"Step {step:02d}: all inputs already decoded this cycle, no download")
+
+    store_inputs(fields, inputs, cycle_id, step)
+    available = with_lagged(fields, history, inputs, step)
+    available = with_ensemble(available, inputs, cycle_start + timedelta(hours=step))
+    results = evaluate_step(PRODUCTS, available)
+    update_history(history, fields, inputs, step)
+
+    for name, values in results.items():
+        if values is None:
+            continue
+        try:
+            png_path = render_product(
+                PRODUCTS[name], values, lats, lons,
+                os.path.join(derived_dir, name), step, manifests[name]
+            )
+            print(f"Generated {name} PNG: {png_path}")
+        except Exception as e:
+            print(f"Error rendering {name} for step {step:02d}: {e}")
+    release_all()
+
+for name, manifest in manifests.items():
+    if manifest["frames"]:
+        build_bundle(os.path.join(derived_dir, name), manifest, f"/bundles/{name}.bin")
+
+evict(ensemble_keys)
+save_metrics("derived", cycle_id)
+print("All derived products complete!")
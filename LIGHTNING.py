@@ -6,14 +6,22 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import cartopy.crs as ccrs
-from matplotlib.colors import Normalize, PowerNorm
 import numpy as np
+from frame_bounds import valid_window, valid_extent, write_empty_frame, new_manifest, record_frame
+from frame_variants import write_variants
+from frame_bundles import build_bundle
+from cycle_store import get_grid, put_field, put_grid
+from lightning_colors import LIGHTNING_NORM_VERSION, LUT_SIZE, lightning_cmap, lightning_indices
+from region_labels import load_region_labels
+from lightning_stats import new_cycle_stats, add_step, save_stats
+from grib_lifecycle import scratch_dir, has_room, written, done, save_metrics
+from regions import REGIONS, ACTIVE_REGIONS, subregion_query, region_dir, region_grib_name, region_figsize
 
 # --- Clean old files ---
 for folder in [
     os.path.join("Hrrr", "static", "lighting", "grib_files"),
     os.path.join("Hrrr", "static", "lighting")
-]:
+] + [region_dir(os.path.join("Hrrr", "static", "lighting"), r) for r in REGIONS]:
     if os.path.exists(folder):
         for f in os.listdir(folder):
             file_path = os.path.join(folder, f)
@@ -22,8 +30,8 @@ for folder in [
 
 # Directories
 output_dir = os.path.join("Hrrr", "static", "lighting")
-grib_dir = os.path.join(output_dir, "grib_files")
-os.makedirs(grib_dir, exist_ok=True)
+# GRIBs go to the (RAM-backed when available) scratch area and are deleted once decoded
+grib_dir = scratch_dir("lightning")
 os.makedirs(output_dir, exist_ok=True)
 
 base_url = "https://nomads.ncep.noaa.gov/cgi-bin/filter_hrrr_2d.pl"
@@ -41,26 +49,50 @@ if current_utc_time.hour < run_hour:
 date_str = date_for_run.strftime("%Y%m%d")
 hour_str = str(run_hour).zfill(2)  # 00, 06, 12, 18
 variable_ltng = "LTNG"
+cycle_id = f"{date_str}_{hour_str}z"
+
+# Region aggregation for the flash statistics (state by default, county with a shapefile)
+region_kind = os.environ.get("LIGHTNING_REGION_KIND", "state")
+region_labels = None
+labels_tried = False
+cycle_stats = new_cycle_stats(cycle_id, region_kind, [])
+cycle_stats["norm_version"] = LIGHTNING_NORM_VERSION
+
+def prepare_region_labels(lats, lons):
+    # Called once per run. The statistics must never cost a frame: if the labels cannot be
+    # built, only the per-region totals are dropped (step totals and hotspots remain)
+    global region_labels, labels_tried, cycle_stats
+    labels_tried = True
+    try:
+        region_labels, region_names = load_region_labels(np.asarray(lats), np.asarray(lons), region_kind)
+    except Exception as e:
+        print(f"Region labels unavailable, skipping per-region lightning totals: {e}")
+        return
+    cycle_stats = new_cycle_stats(cycle_id, region_kind, region_names)
+    cycle_stats["norm_version"] = LIGHTNING_NORM_VERSION
 
-def download_file(hour_str, step):
+def download_file(hour_str, step, region="conus"):
     file_name = f"hrrr.t{hour_str}z.wrfsfcf{step:02d}.grib2"
-    file_path = os.path.join(grib_dir, file_name)
+    file_path = os.path.join(grib_dir, region_grib_name(file_name, region))
     url_ltng = (
         f"{base_url}?dir=%2Fhrrr.{date_str}%2Fconus&file={file_name}"
-        f"&var_{variable_ltng}=on&lev_entire_atmosphere=on"
+        f"&var_{variable_ltng}=on&lev_entire_atmosphere=on{subregion_query(region)}"
     )
+    if not has_room(file_name):
+        return None
     response = requests.get(url_ltng, stream=True)
     if response.status_code == 200:
         with open(file_path, 'wb') as f:
             for chunk in response.iter_content(chunk_size=1024):
                 if chunk:
                     f.write(chunk)
+        written(file_path)
         return file_path
     else:
         print(f"Failed to download {file_name} (Status Code: {response.status_code})")
         return None
 
-def count_and_plot_flashes(file_path, step):
+def count_and_plot_flashes(file_path, step, region, out_dir, manifest):
     try:
         ds = xr.open_dataset(file_path, engine="cfgrib")
 
@@ -74,45 +106,59 @@ def count_and_plot_flashes(file_path, step):
 
         data = ds[lightning_var].squeeze().values  # flash counts/rates per grid cell
 
-        # Mask zeros so they are fully transparent in the plot
-        masked_data = np.ma.masked_where(data == 0, data)
-
-        # Sum total flashes over all grid points 
-        total_flashes = np.nansum(data)
-
         # Coordinates
         lats = ds['latitude'].values
         lons = ds['longitude'].values
+        if region == "conus":
+            # Durable copy for later scripts (DERIVED.py) and /points
+            put_field(cycle_id, "ltng", step, data)
+            put_grid(lats, lons)
+
+            # First run without a stored grid: the labels come from this step's grid instead
+            if not labels_tried:
+                prepare_region_labels(lats, lons)
+            try:
+                # Per-step, cumulative and (with labels) per-region totals
+                total_flashes = add_step(cycle_stats, step, data, lats, lons, region_labels)
+            except Exception as e:
+                print(f"Step {step:02d}: lightning statistics failed: {e}")
+                total_flashes = float(np.nansum(data))
+        else:
+            # Statistics cover the whole domain and come from the CONUS pass only
+            total_flashes = float(np.nansum(data))
+
+        png_name = f"lght_{step:02d}.png"
+        png_path = os.path.join(out_dir, png_name)
+        indices = lightning_indices(data)
+        active = indices > 0
+        extent = valid_extent(active, lats, lons, clip=REGIONS[region]["extent"])
+        if total_flashes <= 0 or extent is None:
+            # Quiet hour: reuse the shared empty frame, no matplotlib work at all
+            write_empty_frame(png_path)
+            record_frame(manifest, out_dir, step, png_name, None)
+            print(f"Step {step:02d}: no flashes, wrote empty frame to {png_path}")
+            return total_flashes
 
         # Plot setup - ONLY plot data, no background, no coastlines, no colorbar
-        plt.figure(figsize=(14, 12), dpi=200)
+        fig = plt.figure(figsize=region_figsize(region, 14, extent, projection="mercator"), dpi=200)
         ax = plt.axes(projection=ccrs.Mercator())
-        ax.set_extent([-126, -69, 24, 50], crs=ccrs.PlateCarree())
-
-        max_val = np.nanmax(data)
-        if max_val == 0:
-            max_val = 1  # avoid zero max in normalization
-
-        # Use perceptually uniform colormap and PowerNorm for better contrast
-        lightning_contour = ax.contourf(
-            lons, lats, masked_data,
-            levels=np.linspace(0, max_val, 100),  # more levels for smoothness
-            cmap='inferno',  # or 'viridis', 'magma', etc.
-            norm=PowerNorm(gamma=0.5, vmin=0, vmax=max_val),  # gamma < 1 boosts low values
-            transform=ccrs.PlateCarree()
+        ax.set_extent(extent, crs=ccrs.PlateCarree())
+
+        # Fixed-scale LUT indices over the active window; 0 (no flashes) is masked so it stays transparent
+        window = valid_window(active, pad_cells=1)
+        ax.pcolormesh(
+            lons[window], lats[window], np.ma.masked_equal(indices[window], 0),
+            cmap=lightning_cmap(), vmin=0, vmax=LUT_SIZE - 1,
+            shading='auto', transform=ccrs.PlateCarree()
         )
 
         # Remove axis lines and labels
         plt.axis('off')
 
-        # Remove any other map features like coastlines or borders (do NOT add them)
-
-        plt.tight_layout()
-
         # Save PNG with transparent background, no padding or borders
-        png_path = os.path.join(output_dir, f"lght_{step:02d}.png")
         plt.savefig(png_path, bbox_inches='tight', pad_inches=0, transparent=True)
-        plt.close()
+        plt.close(fig)
+        record_frame(manifest, out_dir, step, png_name, extent, write_variants(png_path))
 
         print(f"Step {step:02d}: Total flashes = {total_flashes:.0f}, saved plot to {png_path}")
         return total_flashes
@@ -124,11 +170,31 @@ def count_and_plot_flashes(file_path, step):
 # Main
 total_flashes_all_steps = 0
 
-for step in range(0, 49):
-    grib_file = download_file(hour_str, step)
-    if grib_file:
-        flashes = count_and_plot_flashes(grib_file, step)
-        if flashes is not None:
-            total_flashes_all_steps += flashes
+# The HRRR grid is fixed, so the one stored by an earlier run serves for the label raster
+# (cached on disk by region_labels)
+stored_lats, stored_lons = get_grid()
+if stored_lats is not None:
+    prepare_region_labels(stored_lats, stored_lons)
+
+for region in ACTIVE_REGIONS:
+    out_dir = region_dir(output_dir, region)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = new_manifest("lightning", cycle_id, region)
+    for step in range(0, 49):
+        grib_file = download_file(hour_str, step, region)
+        if grib_file:
+            flashes = count_and_plot_flashes(grib_file, step, region, out_dir, manifest)
+            done(grib_file)  # nothing reads the GRIB after this
+            if flashes is not None and region == "conus":
+                total_flashes_all_steps += flashes
+
+    # Single-file loop bundle for streaming the whole animation; per-frame PNGs stay for deep links
+    if region == "conus" and manifest["frames"]:
+        build_bundle(out_dir, manifest, "/bundles/lightning.bin")
 
 print(f"\nTotal lightning flashes in all forecast steps combined: {total_flashes_all_steps:.0f}")
+save_metrics("lightning", cycle_id)
+
+if cycle_stats["steps"]:
+    stats_path = save_stats(cycle_stats)
+    print(f"Saved lightning statistics to {stats_path}")
@@ -7,13 +7,20 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from matplotlib.colors import ListedColormap, BoundaryNorm
 import cartopy.crs as ccrs  # Added for map projection
+import numpy as np
+from frame_bounds import valid_window, valid_extent, write_empty_frame, new_manifest, record_frame
+from frame_variants import write_variants
+from frame_bundles import build_bundle
+from cycle_store import put_field, put_grid
+from grib_lifecycle import scratch_dir, has_room, written, done, save_metrics
+from regions import REGIONS, ACTIVE_REGIONS, subregion_query, region_dir, region_grib_name, region_figsize
 
 # --- Clean up old files in grib_files and pngs directories ---
 for folder in [
     os.path.join("Hrrr", "static", "REFC", "grib_files"),
     os.path.join("Hrrr", "static", "pngs"),
     os.path.join("Hrrr", "static", "REFC")  # Added to clean up PNGs in REFC
-]:
+] + [region_dir(os.path.join("Hrrr", "static", "REFC"), r) for r in REGIONS]:
     if os.path.exists(folder):
         for f in os.listdir(folder):
             file_path = os.path.join(folder, f)
@@ -23,8 +30,8 @@ for folder in [
 base_url = "https://nomads.ncep.noaa.gov/cgi-bin/filter_hrrr_2d.pl"
 output_dir = "Hrrr"
 refc_dir = os.path.join(output_dir, "static", "REFC")
-grib_dir = os.path.join(refc_dir, "grib_files")  # Now inside REFC
-os.makedirs(grib_dir, exist_ok=True)
+# GRIBs go to the (RAM-backed when available) scratch area and are deleted once decoded
+grib_dir = scratch_dir("refc")
 os.makedirs(refc_dir, exist_ok=True)
 
 # Get the current UTC date and time and select the most recent HRRR run (0z, 6z, 12z, 18z)
@@ -39,6 +46,7 @@ if current_utc_time.hour < run_hour:
     run_hour = (date_for_run.hour // 6) * 6
 date_str = date_for_run.strftime("%Y%m%d")
 hour_str = str(run_hour).zfill(2)  # 00, 06, 12, 18
+cycle_id = f"{date_str}_{hour_str}z"
 
 
 # Reflectivity variable and colormap
@@ -53,17 +61,20 @@ cmap = ListedColormap(colors)
 norm = BoundaryNorm(bounds, cmap.N)
 
 # Function to download GRIB files
-def download_file(hour_str, step):
+def download_file(hour_str, step, region="conus"):
     file_name = f"hrrr.t{hour_str}z.wrfsfcf{step:02d}.grib2"
-    file_path = os.path.join(grib_dir, file_name)
+    file_path = os.path.join(grib_dir, region_grib_name(file_name, region))
     url_refc = (f"{base_url}?dir=%2Fhrrr.{date_str}%2Fconus&file={file_name}"
-                f"&var_{variable_refc}=on&lev_entire_atmosphere=on")
+                f"&var_{variable_refc}=on&lev_entire_atmosphere=on{subregion_query(region)}")
+    if not has_room(file_name):
+        return None
     response = requests.get(url_refc, stream=True)
     if response.status_code == 200:
         with open(file_path, 'wb') as f:
             for chunk in response.iter_content(chunk_size=1024):
                 if chunk:
                     f.write(chunk)
+        written(file_path)
         print(f"Downloaded {file_name}")
         return file_path
     else:
@@ -71,37 +82,65 @@ def download_file(hour_str, step):
         return None
 
 # Function to generate a clean PNG from GRIB file (with Cartopy projection)
-def generate_clean_png(file_path, step):
+def generate_clean_png(file_path, step, region, out_dir, manifest):
     ds = xr.open_dataset(file_path, engine="cfgrib")
     refc = ds['refc'].where((ds['refc'] >= 0) & (ds['refc'] <= 75))
     lats = ds['latitude']
     lons = ds['longitude']
-    fig = plt.figure(figsize=(10, 7), dpi=850)
+    if region == "conus":
+        # Durable copy for later scripts (DERIVED.py) and /points
+        put_field(cycle_id, "refc", step, ds['refc'].squeeze().values)
+        put_grid(lats.values, lons.values)
+    png_name = f"REFC_{step:02d}.png"
+    png_path = os.path.join(out_dir, png_name)
+
+    # Cheap pre-render pass: crop to the box that actually has echoes, or skip the step
+    valid = np.isfinite(refc.squeeze().values)
+    extent = valid_extent(valid, lats.values, lons.values, clip=REGIONS[region]["extent"])
+    if extent is None:
+        write_empty_frame(png_path)
+        record_frame(manifest, out_dir, step, png_name, None)
+        print(f"No reflectivity at step {step:02d} ({region}), wrote empty frame: {png_path}")
+        return png_path
+
+    fig = plt.figure(figsize=region_figsize(region, 10, extent), dpi=850)
     ax = plt.axes(projection=ccrs.PlateCarree())
-    ax.set_extent([-126, -69, 24, 50], crs=ccrs.PlateCarree())
+    ax.set_extent(extent, crs=ccrs.PlateCarree())
+    # Only contour the grid window that holds echoes (a few cells of margin for smooth edges)
+    window = valid_window(valid, pad_cells=3)
     # Use contourf for smoother, filled contours
     contour = ax.contourf(
-        lons, lats, refc.squeeze(),
+        lons.values[window], lats.values[window], refc.squeeze().values[window],
         levels=bounds, cmap=cmap, norm=norm, transform=ccrs.PlateCarree(), extend='max'
     )
     # Optionally, add contour lines for clarity
     # ax.contour(lons, lats, refc.squeeze(), levels=bounds, colors='k', linewidths=0.2, transform=ccrs.PlateCarree())
     ax.set_axis_off()
     plt.subplots_adjust(left=0, right=1, top=1, bottom=0)
-    png_path = os.path.join(refc_dir, f"REFC_{step:02d}.png")
     plt.savefig(png_path, bbox_inches='tight', pad_inches=0, transparent=True)
     plt.close(fig)
-    print(f"Generated clean PNG: {png_path}")
+    record_frame(manifest, out_dir, step, png_name, extent, write_variants(png_path))
+    print(f"Generated clean PNG: {png_path} (extent {extent})")
     return png_path
 
-# Main process: Download and plot
+# Main process: Download and plot, once per configured region (each with its own manifest)
 grib_files = []
 png_files = []
-for step in range(0, 49):  # Loop through forecast steps (00 to 48 hours)
-    grib_file = download_file(hour_str, step)
-    if grib_file:
-        grib_files.append(grib_file)
-        png_file = generate_clean_png(grib_file, step)
-        png_files.append(png_file)
+for region in ACTIVE_REGIONS:
+    out_dir = region_dir(refc_dir, region)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = new_manifest("refc", cycle_id, region)
+    for step in range(0, 49):  # Loop through forecast steps (00 to 48 hours)
+        grib_file = download_file(hour_str, step, region)
+        if grib_file:
+            grib_files.append(grib_file)
+            png_file = generate_clean_png(grib_file, step, region, out_dir, manifest)
+            done(grib_file)  # nothing reads the GRIB after this
+            png_files.append(png_file)
+
+    # Single-file loop bundle for streaming the whole animation; per-frame PNGs stay for deep links
+    if region == "conus" and manifest["frames"]:
+        build_bundle(out_dir, manifest, "/bundles/refc.bin")
 
 print("All GRIB file download and PNG creation tasks complete!")
+save_metrics("refc", cycle_id)
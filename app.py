@@ -1,11 +1,22 @@
-from flask import Flask, send_from_directory, jsonify
+from flask import Flask, send_from_directory, jsonify, request, redirect, Response, stream_with_context
 import os
 import re
-import subprocess
-import threading
-import traceback
+from frame_bundles import BUNDLE_DATA, BUNDLE_INDEX
+from frame_bounds import leaflet_bounds, load_manifest
+from products import PRODUCTS, product_listing
+from regions import REGIONS, region_dir, region_listing
+from basemap_builder import BASEMAP_DIR, load_index as load_basemap_index
+from cycle_store import cycle_time, get_grid, list_cycles as list_stored_cycles
+from point_extract import FORMATS, METHODS, expected_fields, extract, missing_fields, parse_points, sample_cycle, step_ranges
+from events import follow as follow_events, since as events_since, streaming_supported
+from grib_lifecycle import load_metrics as load_grib_metrics
+from render_cache import RENDER_CACHE_DIR, lookup as lookup_render, request_render
+from pipeline_launcher import launch_pipeline
+from lightning_stats import STATS_DIR as LIGHTNING_STATS_DIR, latest_stats_path
 
 app = Flask(__name__)
+# Behind nginx/Apache, let the proxy stream files (X-Sendfile) instead of the worker
+app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE") == "1"
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PNG_DIR = os.path.join("Hrrr", "static", "pngs")
@@ -13,19 +24,45 @@ PNG_DIR_REFC = os.path.join("Hrrr", "static", "REFC")
 PNG_DIR_MSLP = os.path.join("Hrrr", "static", "MSLP")
 PNG_DIR_TEMP2M = os.path.join("Hrrr", "static", "2mtemp")
 PNG_DIR_LIGHTNING = os.path.join("Hrrr", "static", "lighting")
+DERIVED_DIR = os.path.join("Hrrr", "static", "derived")
+BUNDLE_DIRS = {
+    "refc": PNG_DIR_REFC,
+    "mslp": PNG_DIR_MSLP,
+    "temp2m": PNG_DIR_TEMP2M,
+    "lightning": PNG_DIR_LIGHTNING,
+}
+BUNDLE_DIRS.update({name: os.path.join(DERIVED_DIR, name) for name in PRODUCTS})
+PNG_URL_PREFIXES = {"refc": "/refc_pngs", "mslp": "/mslp_pngs", "temp2m": "/temp2m_pngs", "lightning": "/lightning_pngs"}
 COLORBAR_DIR = os.path.join(BASE_DIR, "colorbars")  # Serve from project root colorbars folder
+# Basemap file names hash their parameters, so a given URL never changes content
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 @app.route("/")
 def home():
     return send_from_directory(BASE_DIR, "usa_leaflet.html")
 
+def list_dir(path):
+    # Regional folders only exist once a script has rendered that region
+    return os.listdir(path) if os.path.isdir(path) else []
+
 @app.route("/reflectivity_images")
 def get_pngs():
+    # ?region=northeast lists that region's frames; the default is the CONUS set
+    region = request.args.get("region", "conus")
+    if region not in REGIONS:
+        return jsonify({"error": "Unknown region"}), 404
+    dirs = {
+        "refc": region_dir(PNG_DIR_REFC, region),
+        "mslp": region_dir(PNG_DIR_MSLP, region),
+        "temp2m": region_dir(PNG_DIR_TEMP2M, region),
+        "lightning": region_dir(PNG_DIR_LIGHTNING, region),
+    }
+
     # Find all REFC, MSLP, 2mtemp, and Lightning PNGs by hour
-    refc_files = [f for f in os.listdir(PNG_DIR_REFC) if re.match(r"REFC_(\d+)\.png$", f)]
-    mslp_files = [f for f in os.listdir(PNG_DIR_MSLP) if re.match(r"MSLP_(\d+)\.png$", f)]
-    temp2m_files = [f for f in os.listdir(PNG_DIR_TEMP2M) if re.match(r"2mtemp_(\d+)\.png$", f)]
-    lightning_files = [f for f in os.listdir(PNG_DIR_LIGHTNING) if re.match(r"lght_(\d+)\.png$", f)]
+    refc_files = [f for f in list_dir(dirs["refc"]) if re.match(r"REFC_(\d+)\.png$", f)]
+    mslp_files = [f for f in list_dir(dirs["mslp"]) if re.match(r"MSLP_(\d+)\.png$", f)]
+    temp2m_files = [f for f in list_dir(dirs["temp2m"]) if re.match(r"2mtemp_(\d+)\.png$", f)]
+    lightning_files = [f for f in list_dir(dirs["lightning"]) if re.match(r"lght_(\d+)\.png$", f)]
 
     # Use regex to extract hour from each filename (more robust)
     def extract_hour(pattern, filename):
@@ -47,17 +84,59 @@ def get_pngs():
     all_hours = set(refc_dict) | set(mslp_dict) | set(temp2m_dict) | set(lightning_dict)
     all_hours = sorted(all_hours)
 
+    # Per-frame bounds published by the render scripts (cropped box, or None when empty)
+    manifests = {product: load_manifest(path)["frames"] for product, path in dirs.items()}
+    full_bounds = leaflet_bounds(REGIONS[region]["extent"])
+
+    # Regional frames live in a subfolder that the per-product PNG routes serve as a path
+    url_prefixes = {
+        product: prefix if region == "conus" else f"{prefix}/{region}"
+        for product, prefix in PNG_URL_PREFIXES.items()
+    }
+
+    def frame_bounds(product, hour):
+        frame = manifests[product].get(f"{hour:02d}")
+        return frame["bounds"] if frame else full_bounds
+
+    def frame_variants(product, hour):
+        # {pixel width: url} ladder of downsampled copies, chosen client-side by zoom and DPR
+        frame = manifests[product].get(f"{hour:02d}") or {}
+        return {
+            width: f"{url_prefixes[product]}/{name}"
+            for width, name in frame.get("variants", {}).items()
+        }
+
     result = []
     for hour in all_hours:
         result.append({
             "hour": hour,
-            "refc": f"/refc_pngs/{refc_dict[hour]}" if hour in refc_dict else None,
-            "mslp": f"/mslp_pngs/{mslp_dict[hour]}" if hour in mslp_dict else None,
-            "temp2m": f"/temp2m_pngs/{temp2m_dict[hour]}" if hour in temp2m_dict else None,
-            "lightning": f"/lightning_pngs/{lightning_dict[hour]}" if hour in lightning_dict else None
+            "refc": f"{url_prefixes['refc']}/{refc_dict[hour]}" if hour in refc_dict else None,
+            "mslp": f"{url_prefixes['mslp']}/{mslp_dict[hour]}" if hour in mslp_dict else None,
+            "temp2m": f"{url_prefixes['temp2m']}/{temp2m_dict[hour]}" if hour in temp2m_dict else None,
+            "lightning": f"{url_prefixes['lightning']}/{lightning_dict[hour]}" if hour in lightning_dict else None,
+            "refc_bounds": frame_bounds("refc", hour),
+            "mslp_bounds": frame_bounds("mslp", hour),
+            "temp2m_bounds": frame_bounds("temp2m", hour),
+            "lightning_bounds": frame_bounds("lightning", hour),
+            "refc_variants": frame_variants("refc", hour),
+            "mslp_variants": frame_variants("mslp", hour),
+            "temp2m_variants": frame_variants("temp2m", hour),
+            "lightning_variants": frame_variants("lightning", hour)
         })
     return jsonify(result)
 
+@app.route("/regions")
+def get_regions():
+    # Named regions with their overlay bounds and which products have regional frames this cycle
+    result = []
+    for entry in region_listing():
+        entry["products"] = {
+            product: load_manifest(region_dir(path, entry["name"])).get("cycle")
+            for product, path in [("refc", PNG_DIR_REFC), ("mslp", PNG_DIR_MSLP), ("temp2m", PNG_DIR_TEMP2M), ("lightning", PNG_DIR_LIGHTNING)]
+        }
+        result.append(entry)
+    return jsonify(result)
+
 @app.route("/refc_pngs/<path:filename>")
 def serve_refc_png(filename):
     return send_from_directory(PNG_DIR_REFC, filename)
@@ -74,59 +153,219 @@ def serve_temp2m_png(filename):
 def serve_lightning_png(filename):
     return send_from_directory(PNG_DIR_LIGHTNING, filename)
 
+@app.route("/derived_products")
+def get_derived_products():
+    # Registry metadata plus the frames each product has published this cycle
+    result = []
+    for product in product_listing():
+        name = product["name"]
+        frames = load_manifest(os.path.join(DERIVED_DIR, name))["frames"]
+        product["frames"] = {
+            int(step): {
+                "url": f"/derived_pngs/{name}/{frame['file']}",
+                "bounds": frame["bounds"],
+                "variants": {w: f"/derived_pngs/{name}/{f}" for w, f in frame.get("variants", {}).items()},
+            }
+            for step, frame in frames.items()
+        }
+        result.append(product)
+    return jsonify(result)
+
+@app.route("/derived_pngs/<product>/<path:filename>")
+def serve_derived_png(product, filename):
+    if product not in PRODUCTS:
+        return jsonify({"error": "Unknown product"}), 404
+    return send_from_directory(os.path.join(DERIVED_DIR, product), filename)
+
+@app.route("/render/<product>/<int:step>")
+def render_on_demand(product, step):
+    # Frames not pre-rendered (prerender=False products, or steps DERIVED.py skipped) are
+    # drawn by the warm render_server.py workers and kept in an LRU disk cache
+    if product not in PRODUCTS or not 0 <= step <= 48:
+        return jsonify({"error": "Unknown product or step"}), 404
+    cycles = list_stored_cycles()
+    if not cycles:
+        return jsonify({"error": "No decoded fields available yet"}), 404
+    cycle = cycles[-1]
+
+    if PRODUCTS[product]["prerender"]:
+        frame = load_manifest(os.path.join(DERIVED_DIR, product))
+        entry = frame["frames"].get(f"{step:02d}") if frame.get("cycle") == cycle else None
+        if entry is not None:
+            return jsonify({"product": product, "cycle": cycle, "step": step, "bounds": entry["bounds"],
+                            "empty": entry["empty"], "url": f"/derived_pngs/{product}/{entry['file']}", "cached": True})
+
+    info = lookup_render(cycle, product, step)
+    if info is None:
+        try:
+            info = request_render(cycle, product, step)
+        except OSError as e:
+            return jsonify({"error": f"Render server unavailable: {e}"}), 503
+        if info.get("status") != "ok":
+            return jsonify({"error": info.get("error")}), info.get("code", 500)
+    else:
+        info = dict(info, cached=True)
+    return jsonify({"product": product, "cycle": cycle, "step": step, "bounds": info["bounds"], "empty": info["empty"],
+                    "url": f"/render_cache/{cycle}/{info['file']}", "cached": info.get("cached", False),
+                    "render_ms": info.get("render_ms", 0)})
+
+@app.route("/render_cache/<cycle>/<filename>")
+def serve_rendered(cycle, filename):
+    # A cycle's on-demand frame never changes, so browsers may keep it
+    response = send_from_directory(os.path.join(RENDER_CACHE_DIR, cycle), filename, max_age=31536000)
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+@app.route("/bundles/<product>.json")
+def serve_bundle_index(product):
+    if product not in BUNDLE_DIRS:
+        return jsonify({"error": "Unknown product"}), 404
+    return send_from_directory(BUNDLE_DIRS[product], BUNDLE_INDEX, mimetype="application/json")
+
+@app.route("/bundles/<product>.bin")
+def serve_bundle_data(product):
+    # send_from_directory answers Range requests, so single frames can be fetched by offset
+    if product not in BUNDLE_DIRS:
+        return jsonify({"error": "Unknown product"}), 404
+    return send_from_directory(BUNDLE_DIRS[product], BUNDLE_DATA, mimetype="application/octet-stream")
+
+@app.route("/points", methods=["POST"])
+def extract_points():
+    # Bulk sampling for partner feeds: POST JSON or CSV points, get every decoded field and
+    # derived product for every step of the latest cycle. ?format=json|csv|arrow,
+    # ?method=nearest|bilinear
+    fmt = request.args.get("format", "json")
+    method = request.args.get("method", "nearest")
+    if fmt not in FORMATS or method not in METHODS:
+        return jsonify({"error": f"format must be one of {list(FORMATS)}, method one of {list(METHODS)}"}), 400
+    if fmt == "arrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return jsonify({"error": "Arrow output needs pyarrow on the server"}), 501
+    try:
+        ids, point_lats, point_lons = parse_points(request.get_data(), request.content_type)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Read from the durable cycle store (not the evicted, RAM-backed field cache) so a
+    # field is either served or explicitly reported missing
+    cycles = list_stored_cycles()
+    lats, lons = get_grid()
+    if not cycles or lats is None or lons is None:
+        return jsonify({"error": "No decoded fields available yet"}), 404
+    cycle = cycles[-1]
+    names = expected_fields(PRODUCTS)
+    table = sample_cycle(cycle, cycle_time(cycle), PRODUCTS, lats, lons, point_lats, point_lons, method)
+    missing = missing_fields(names, table)
+    units = {name: product["units"] for name, product in PRODUCTS.items()}
+    chunks = extract(cycle, cycle_time(cycle), names, table, missing, ids, point_lats, point_lons, method, fmt, units)
+    response = Response(stream_with_context(chunks), mimetype=FORMATS[fmt][0])
+    if missing:
+        # Also in the JSON body / Arrow metadata; this covers CSV
+        response.headers["X-Missing-Steps"] = ";".join(f"{name}={step_ranges(steps)}" for name, steps in missing.items())
+    return response
+
+def with_frame_urls(event):
+    # Step events carry file names; resolve them to the routes below (cycle-versioned,
+    # since a new run rewrites the same file names)
+    if event.get("type") != "step":
+        return event
+    product, region, frame = event["product"], event.get("region", "conus"), event["frame"]
+    if product in PNG_URL_PREFIXES:
+        prefix = PNG_URL_PREFIXES[product] if region == "conus" else f"{PNG_URL_PREFIXES[product]}/{region}"
+    elif product in PRODUCTS:
+        prefix = f"/derived_pngs/{product}"
+    else:
+        return event
+    version = f"?v={event['cycle']}"
+    event["url"] = f"{prefix}/{frame['file']}{version}"
+    event["variants"] = {width: f"{prefix}/{name}{version}" for width, name in frame.get("variants", {}).items()}
+    return event
+
+@app.route("/events")
+def stream_events():
+    # Server-sent events: "step" when a frame lands, "cycle" when a run completes, "resync"
+    # when the client fell too far behind. EventSource reconnects with Last-Event-ID.
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    if not streaming_supported():
+        # Threaded/sync workers: an idle stream would hold a worker slot for minutes. 204
+        # tells EventSource not to reconnect; the page polls /events/poll instead.
+        return "", 204
+    return Response(
+        stream_with_context(follow_events(last_event_id, decorate=with_frame_urls)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route("/events/poll")
+def poll_events():
+    # Fallback for workers that cannot hold streams: the same events, one request per poll
+    events, last_event_id = events_since(request.args.get("last_event_id"), decorate=with_frame_urls)
+    return jsonify({"events": events, "last_event_id": last_event_id})
+
+@app.route("/lightning_stats")
+def get_lightning_stats():
+    # Precomputed by LIGHTNING.py for the latest cycle; no GRIB reads here
+    path = latest_stats_path()
+    if path is None:
+        return jsonify({"error": "No lightning statistics available yet"}), 404
+    return send_from_directory(LIGHTNING_STATS_DIR, os.path.basename(path), mimetype="application/json")
+
+@app.route("/lightning_stats/<cycle>")
+def get_lightning_stats_cycle(cycle):
+    # cycle looks like 20250101_18z
+    if not re.match(r"\d{8}_\d{2}z$", cycle):
+        return jsonify({"error": "Invalid cycle"}), 400
+    return send_from_directory(LIGHTNING_STATS_DIR, f"{cycle}.json", mimetype="application/json")
+
+@app.route("/grib_metrics")
+def get_grib_metrics():
+    # Per-script GRIB bytes written / deleted / retained for the last run, plus the size of
+    # each area the pipeline keeps under Hrrr/ and the free space left
+    return jsonify(load_grib_metrics())
+
 @app.route("/colorbar/<path:filename>")
 def serve_colorbar(filename):
     return send_from_directory(COLORBAR_DIR, filename)
 
+@app.route("/basemaps")
+def get_basemaps():
+    # {region: {bounds, styles: {style: {width: filename}}}} written by BASEMAP.py
+    index = load_basemap_index()
+    for entry in index.values():
+        for style, ladder in entry["styles"].items():
+            entry["styles"][style] = {width: f"/basemaps/{name}" for width, name in ladder.items()}
+    return jsonify(index)
+
+@app.route("/basemaps/<filename>")
+def serve_basemap(filename):
+    response = send_from_directory(BASEMAP_DIR, filename, max_age=31536000)
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
+
 @app.route("/cartopy_base.png")
 def serve_cartopy_base():
+    # Old URL: point at the current CONUS basemap (short-lived redirect, immutable target)
+    ladder = load_basemap_index().get("conus", {}).get("styles", {}).get("default")
+    if ladder:
+        width = max(int(w) for w in ladder)
+        return redirect(f"/basemaps/{ladder[str(width)]}")
     return send_from_directory(BASE_DIR, "cartopy_base.png")
 
 @app.route("/run-task")
 def run_task():
-    def run_all_scripts():
-        try:
-            subprocess.run(["python", os.path.join(BASE_DIR, "REFC.py")], check=True)
-            print("REFC.py ran successfully!")
-        except subprocess.CalledProcessError:
-            error_trace = traceback.format_exc()
-            print(f"Error running REFC.py:\n{error_trace}")
-
-        try:
-            subprocess.run(["python", os.path.join(BASE_DIR, "mslp_script.py")], check=True)
-            print("mslp_script.py ran successfully!")
-        except subprocess.CalledProcessError:
-            error_trace = traceback.format_exc()
-            print(f"Error running mslp_script.py:\n{error_trace}")
-
-        try:
-            subprocess.run(["python", os.path.join(BASE_DIR, "temp2m.py")], check=True)
-            print("temp2m.py ran successfully!")
-        except subprocess.CalledProcessError:
-            error_trace = traceback.format_exc()
-            print(f"Error running temp2m.py:\n{error_trace}")
-
-        try:
-            subprocess.run(["python", os.path.join(BASE_DIR, "LIGHTNING.py")], check=True)
-            print("LIGHTNING.py ran successfully!")
-        except subprocess.CalledProcessError:
-            error_trace = traceback.format_exc()
-            print(f"Error running LIGHTNING.py:\n{error_trace}")
-
-    threading.Thread(target=run_all_scripts).start()
+    # Scripts run sequentially in a detached process, never inside this web worker
+    pid = launch_pipeline()
+    if pid is None:
+        return "Pipeline is already running.", 409
     return "All scripts started sequentially in background!", 200
 
 @app.route("/run-mslp")
 def run_mslp_script():
-    def run_mslp():
-        try:
-            subprocess.run(["python", "mslp_script.py"], check=True)
-            print("mslp_script.py ran successfully!")
-        except subprocess.CalledProcessError as e:
-            error_trace = traceback.format_exc()
-            print(f"Error running mslp_script.py asynchronously:\n{error_trace}")
-
-    threading.Thread(target=run_mslp).start()
+    pid = launch_pipeline(["mslp_script.py"])
+    if pid is None:
+        return "Pipeline is already running.", 409
     return "mslp_script.py started in background!", 200
 
 @app.route("/<path:filename>")
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+from frame_bounds import leaflet_bounds
+from frame_variants import VARIANT_WIDTHS
+from regions import REGIONS, ACTIVE_REGIONS
+
+# Static basemaps (coastlines, borders, states) drawn once per region, width and style.
+#
+# Every image is named after a hash of everything that affects its pixels, so a file
+# never changes once written: the app serves it with an immutable Cache-Control and a
+# parameter change simply produces a new name. Nothing here runs in the per-cycle render
+# scripts; Natural Earth shapefiles are only read when a missing basemap is built.
+BASEMAP_DIR = os.path.join("Hrrr", "basemaps")
+BASEMAP_INDEX = "index.json"
+
+# Bump when the drawing code changes in a way the parameters below do not capture
+BASEMAP_VERSION = 1
+
+STYLES = {
+    "default": {
+        "land": "#f2efe9", "ocean": "#c9dff0", "lakes": "#c9dff0",
+        "coastline": "#333333", "borders": "#333333", "states": "#7a7a7a",
+        "linewidth": 0.6,
+    },
+    "dark": {
+        "land": "#1e2126", "ocean": "#0d1a26", "lakes": "#0d1a26",
+        "coastline": "#d0d0d0", "borders": "#d0d0d0", "states": "#6c6c6c",
+        "linewidth": 0.6,
+    },
+}
+
+
+def _natural_earth_scale(width):
+    # 10m outlines only pay off on the widest images
+    return "10m" if width >= 4096 else "50m"
+
+
+def basemap_params(extent, width, style="default"):
+    return {
+        "version": BASEMAP_VERSION,
+        "extent": list(extent),
+        "width": width,
+        "style": STYLES[style],
+        "scale": _natural_earth_scale(width),
+        # Same projection as the data overlays so the outlines line up with them
+        "projection": "platecarree",
+    }
+
+
+def basemap_name(extent, width, style="default"):
+    params = json.dumps(basemap_params(extent, width, style), sort_keys=True)
+    digest = hashlib.sha1(params.encode()).hexdigest()[:16]
+    return f"basemap_{style}_{width}_{digest}.png"
+
+
+def build_basemap(extent, width, style="default", out_dir=BASEMAP_DIR):
+    """Render one basemap unless a file with the same parameters already exists; returns its name."""
+    name = basemap_name(extent, width, style)
+    path = os.path.join(out_dir, name)
+    if os.path.exists(path):
+        return name
+
+    # Heavy imports only when something actually has to be drawn
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import cartopy.crs as ccrs
+    import cartopy.feature as cfeature
+
+    colors = STYLES[style]
+    scale = _natural_earth_scale(width)
+    west, east, south, north = extent
+    dpi = 100
+    fig = plt.figure(figsize=(width / dpi, width / dpi * (north - south) / (east - west)), dpi=dpi)
+    ax = plt.axes([0, 0, 1, 1], projection=ccrs.PlateCarree())
+    ax.set_extent(extent, crs=ccrs.PlateCarree())
+    ax.set_facecolor(colors["ocean"])
+    ax.add_feature(cfeature.LAND.with_scale(scale), facecolor=colors["land"], edgecolor="none")
+    ax.add_feature(cfeature.LAKES.with_scale(scale), facecolor=colors["lakes"], edgecolor="none")
+    ax.add_feature(cfeature.STATES.with_scale(scale), facecolor="none", edgecolor=colors["states"], linewidth=colors["linewidth"] * 0.6)
+    ax.add_feature(cfeature.BORDERS.with_scale(scale), edgecolor=colors["borders"], linewidth=colors["linewidth"])
+    ax.add_feature(cfeature.COASTLINE.with_scale(scale), edgecolor=colors["coastline"], linewidth=colors["linewidth"])
+    ax.set_axis_off()
+
+    os.makedirs(out_dir, exist_ok=True)
+    tmp_path = path + ".tmp.png"
+    fig.savefig(tmp_path, dpi=dpi, pad_inches=0)
+    plt.close(fig)
+    os.replace(tmp_path, path)
+    print(f"Built basemap {name} ({width}px, {style}, {scale})")
+    return name
+
+
+def build_all(styles=None, widths=VARIANT_WIDTHS, out_dir=BASEMAP_DIR):
+    """Make sure every active region's style/width basemap exists and write the index the app serves.
+
+    On a full build, files the previous index listed for an active region are removed once
+    the new index no longer points at them. Inactive regions' files are left alone (names
+    are content hashes, so re-activating a region reuses them).
+    """
+    previous = load_index(out_dir)
+    index = {}
+    for region in ACTIVE_REGIONS:
+        spec = REGIONS[region]
+        entry = {"bounds": leaflet_bounds(spec["extent"]), "styles": {}}
+        for style in styles or STYLES:
+            # Regions drawn at a higher pixel density get proportionally wider basemaps
+            entry["styles"][style] = {
+                str(width * spec["scale"]): build_basemap(spec["extent"], width * spec["scale"], style, out_dir)
+                for width in widths
+            }
+        index[region] = entry
+
+    path = os.path.join(out_dir, BASEMAP_INDEX)
+    with open(path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(path + ".tmp", path)
+
+    if styles is not None:
+        return index
+    current = {name for entry in index.values() for ladder in entry["styles"].values() for name in ladder.values()}
+    for region in ACTIVE_REGIONS:
+        for ladder in previous.get(region, {}).get("styles", {}).values():
+            for name in ladder.values():
+                if name not in current and os.path.exists(os.path.join(out_dir, name)):
+                    os.remove(os.path.join(out_dir, name))
+    return index
+
+
+def load_index(out_dir=BASEMAP_DIR):
+    try:
+        with open(os.path.join(out_dir, BASEMAP_INDEX)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
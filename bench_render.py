@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+# Cold vs warm latency of on-demand rendering (render_server.py).
+#
+#   cold: a fresh `python render_server.py --once <product> <step>` per frame, i.e. what
+#         spawning a script costs: interpreter start, matplotlib/cartopy/xarray imports,
+#         grid mapping, then the draw
+#   warm: the same frames requested from the running pre-forked workers (cache bypassed)
+#   hit:  the same frames again through the render cache, as the web app sees a repeat
+#
+# Needs decoded fields in cycle_store (run the pipeline first), or --synthetic to seed a
+# throwaway store with a HRRR-sized grid:
+#   python bench_render.py --product wind_speed_10m --steps 0 1 2 --synthetic
+#
+# The bench runs its own render server with its own socket, lock, pid file and render
+# cache under BENCH_DIR (removed afterwards), so it never touches a production server or
+# fills the production render cache.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(BASE_DIR, "Hrrr", "cache", "bench")
+
+
+def seed_synthetic(cycle, steps):
+    import numpy as np
+    from pyproj import Proj
+    import cycle_store
+    from point_extract import HRRR_LCC
+    from products import PRODUCTS
+
+    proj = Proj(**HRRR_LCC)
+    x0, y0 = proj(-122.719528, 21.138123)  # HRRR grid origin
+    x, y = np.meshgrid(x0 + 3000 * np.arange(1799), y0 + 3000 * np.arange(1059))
+    lons, lats = proj(x, y, inverse=True)
+    cycle_store.put_grid(lats.astype(np.float32), (lons + 360).astype(np.float32))
+    keys = {spec["key"] for product in PRODUCTS.values() for spec in product["inputs"]}
+    for step in steps:
+        for key in keys:
+            # Smooth synoptic-scale pattern, so contour complexity resembles real fields
+            values = 20 * np.sin(lats / 4 + step) * np.cos(lons / 6) + 20
+            cycle_store.put_field(cycle, key, step, values)
+
+
+def summarize(name, times):
+    print(f"{name:>5}: median {statistics.median(times) * 1000:8.0f} ms   "
+          f"min {min(times) * 1000:8.0f} ms   max {max(times) * 1000:8.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="On-demand render latency benchmark")
+    parser.add_argument("--product", default="wind_speed_10m")
+    parser.add_argument("--steps", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--synthetic", action="store_true", help="seed a temporary cycle store first")
+    args = parser.parse_args()
+
+    # Set before render_cache / cycle_store are imported, here and in the children
+    shutil.rmtree(BENCH_DIR, ignore_errors=True)
+    bench_env = {
+        "HRRR_RENDER_SOCKET": os.path.join(BENCH_DIR, "render.sock"),
+        "HRRR_RENDER_CACHE": os.path.join(BENCH_DIR, "render"),
+        "HRRR_FIELD_CACHE": os.path.join(BENCH_DIR, "fields"),
+    }
+    if args.synthetic:
+        bench_env["HRRR_CYCLE_STORE"] = os.path.join(BENCH_DIR, "cycle_store")
+    os.environ.update(bench_env)
+    env = dict(os.environ)
+    try:
+        run(args, env)
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+
+def run(args, env):
+    if args.synthetic:
+        seed_synthetic("20000101_00z", args.steps)
+    from cycle_store import list_cycles
+    from render_cache import request_render
+    cycles = list_cycles()
+    if not cycles:
+        sys.exit("No cycle in the cycle store (run the pipeline or pass --synthetic)")
+    cycle = cycles[-1]
+
+    cold = []
+    for step in args.steps:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(BASE_DIR, "render_server.py"), "--once", args.product, str(step)],
+                       cwd=BASE_DIR, env=env, check=True, capture_output=True)
+        cold.append(time.perf_counter() - start)
+
+    server = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "render_server.py")], cwd=BASE_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        request_render(cycle, args.product, args.steps[0], force=True)  # wait until the workers are up
+        warm, hit = [], []
+        for step in args.steps:
+            start = time.perf_counter()
+            reply = request_render(cycle, args.product, step, force=True)
+            warm.append(time.perf_counter() - start)
+            assert reply["status"] == "ok", reply
+        for step in args.steps:
+            start = time.perf_counter()
+            request_render(cycle, args.product, step)
+            hit.append(time.perf_counter() - start)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(json.dumps({"product": args.product, "cycle": cycle, "steps": args.steps}))
+    summarize("cold", cold)
+    summarize("warm", warm)
+    summarize("hit", hit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import socket
+import statistics
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+# Load benchmark for the serving profiles in gunicorn.conf.py.
+#
+# Start the server with the profile to test, e.g.
+#   WEB_WORKER_CLASS=sync    gunicorn -c gunicorn.conf.py app:app
+#   WEB_WORKER_CLASS=gthread gunicorn -c gunicorn.conf.py app:app
+#   WEB_WORKER_CLASS=gevent  gunicorn -c gunicorn.conf.py app:app
+# then run
+#   python bench_serving.py --url http://localhost:5000 --slow-clients 50 --fast-clients 20
+#
+# Slow clients download a big frame at a throttled rate (like phones on a bad link) and hold
+# their connection; fast clients hit the JSON listing. With sync workers every slow client
+# pins a worker, so fast-client latency explodes; async/threaded profiles keep it flat.
+
+
+def slow_client(url, rate_bytes, stop, stats):
+    # Raw socket with a tiny receive window, so the server cannot dump the whole frame
+    # into kernel buffers and move on; it has to trickle it out like to a real slow link
+    parts = urllib.parse.urlsplit(url)
+    request = f"GET {parts.path} HTTP/1.1\r\nHost: {parts.netloc}\r\nConnection: close\r\n\r\n".encode()
+    while not stop.is_set():
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+                sock.settimeout(60)
+                sock.connect((parts.hostname, parts.port or 80))
+                sock.sendall(request)
+                while not stop.is_set():
+                    chunk = sock.recv(rate_bytes)
+                    if not chunk:
+                        stats["slow_done"] += 1
+                        break
+                    time.sleep(1)
+        except Exception:
+            stats["slow_errors"] += 1
+
+
+def fast_client(url, stop, latencies, stats):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=60) as response:
+                response.read()
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            stats["fast_errors"] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serving load benchmark")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--frame", default="/temp2m_pngs/2mtemp_22.png", help="large file the slow clients download")
+    parser.add_argument("--listing", default="/reflectivity_images", help="cheap endpoint the fast clients poll")
+    parser.add_argument("--slow-clients", type=int, default=50)
+    parser.add_argument("--fast-clients", type=int, default=20)
+    parser.add_argument("--slow-rate", type=int, default=16 * 1024, help="bytes/second per slow client")
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    latencies = []
+    stats = {"slow_done": 0, "slow_errors": 0, "fast_errors": 0}
+    threads = [
+        threading.Thread(target=slow_client, args=(args.url + args.frame, args.slow_rate, stop, stats), daemon=True)
+        for _ in range(args.slow_clients)
+    ] + [
+        threading.Thread(target=fast_client, args=(args.url + args.listing, stop, latencies, stats), daemon=True)
+        for _ in range(args.fast_clients)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+
+    print(f"{args.slow_clients} slow + {args.fast_clients} fast clients for {args.duration:.0f}s")
+    if latencies:
+        ordered = sorted(latencies)
+        p95 = ordered[int(len(ordered) * 0.95) - 1] if len(ordered) >= 20 else ordered[-1]
+        print(f"fast requests: {len(latencies)} ({len(latencies) / args.duration:.1f} req/s)")
+        print(f"fast latency: p50 {statistics.median(ordered) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms")
+    else:
+        print("fast requests: none completed")
+    print(f"errors: fast {stats['fast_errors']}, slow {stats['slow_errors']}; slow downloads finished: {stats['slow_done']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.colors import ListedColormap, PowerNorm
+import numpy as np
+from lightning_colors import (
+    LIGHTNING_GAMMA, LIGHTNING_NORM_VERSION, LIGHTNING_VMAX, LIGHTNING_VMIN, lightning_lut
+)
+
+# Lightning colorbar built from the same lookup table the frames are rendered with
+lightning_ticks = np.arange(LIGHTNING_VMIN, LIGHTNING_VMAX + 1, 2)
+cmap = ListedColormap(lightning_lut()[1:])  # skip the transparent "no flashes" entry
+
+fig, ax = plt.subplots(figsize=(8, 1.2), dpi=300)
+fig.subplots_adjust(bottom=0.5, top=0.9, left=0.05, right=0.95)
+
+norm = PowerNorm(gamma=LIGHTNING_GAMMA, vmin=LIGHTNING_VMIN, vmax=LIGHTNING_VMAX)
+cb = matplotlib.colorbar.ColorbarBase(
+    ax, cmap=cmap, norm=norm, orientation='horizontal', extend='max'
+)
+cb.set_label('Lightning (flashes/grid cell)')
+cb.set_ticks(lightning_ticks)
+cb.set_ticklabels([str(int(t)) for t in lightning_ticks])
+
+png_path = os.path.join("colorbars", "LIGHTNING_colorbar.png")
+plt.savefig(png_path, bbox_inches='tight', pad_inches=0.1, transparent=True)
+plt.close(fig)
+print(f"Colorbar PNG (scale v{LIGHTNING_NORM_VERSION}) saved as {png_path}")
@@ -0,0 +1,221 @@
+import json
+import os
+import shutil
+import warnings
+from datetime import datetime, timedelta
+import numpy as np
+
+# Compact store of decoded fields from the last few HRRR cycles, kept across runs
+# (everything under Hrrr/static is wiped per cycle, the field cache only lives for one
+# cycle and is RAM-backed). Layout:
+#   Hrrr/cycle_store/<cycle>/<key>/<step>.npy   int16, one chunk per forecast step
+#   Hrrr/cycle_store/<cycle>/<key>/meta.json    {step: [scale, offset]}
+#   Hrrr/cycle_store/grid/{latitude,longitude}.npy   float32 grid geometry
+# Fields are quantized to int16 with a per-step scale/offset; NaN maps to QUANT_NAN.
+#
+# The newest cycle holds every field the scripts and DERIVED.py decode (the source for
+# /points and on-demand renders; products are recomputed from these, never stored). Older
+# cycles are only kept for the lagged ensemble, so evict() trims them down to the keys it
+# is asked to keep. Everything, the newest cycle included, counts toward STORE_MAX_BYTES:
+# one full cycle is about 1.9 GB, each trimmed older one about 190 MB.
+STORE_DIR = os.environ.get("HRRR_CYCLE_STORE") or os.path.join("Hrrr", "cycle_store")
+# Stored by the render scripts themselves (conus only); DERIVED.py adds the other inputs
+SCRIPT_FIELDS = ("refc", "mslma", "t2m", "ltng")
+STORE_CYCLES = int(os.environ.get("HRRR_STORE_CYCLES", 4))
+STORE_MAX_BYTES = int(os.environ.get("HRRR_STORE_MAX_BYTES", 3 * 1024 ** 3))
+
+QUANT_NAN = np.int16(-32768)
+QUANT_MAX = 32767
+
+
+def cycle_time(cycle):
+    # "20250101_18z" -> datetime of the model initialization
+    return datetime.strptime(cycle[:-1], "%Y%m%d_%H")
+
+
+def _meta_path(cycle, key):
+    return os.path.join(STORE_DIR, cycle, key, "meta.json")
+
+
+def _load_meta(cycle, key):
+    try:
+        with open(_meta_path(cycle, key)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def put_field(cycle, key, step, values):
+    """Quantize one decoded step to int16 and write it as its own chunk.
+
+    A failure to write is logged and reported as False; it never stops a render script.
+    """
+    try:
+        _put_field(cycle, key, step, values)
+    except OSError as e:
+        print(f"Cycle store error for {cycle}/{key}/{step:02d}, continuing without it: {e}")
+        return False
+    return True
+
+
+def _put_field(cycle, key, step, values):
+    values = np.asarray(values, dtype=np.float32)
+    finite = np.isfinite(values)
+    if finite.any():
+        lo, hi = float(values[finite].min()), float(values[finite].max())
+    else:
+        lo = hi = 0.0
+    offset = (hi + lo) / 2
+    scale = (hi - lo) / (2 * QUANT_MAX - 2) or 1.0  # keep QUANT_NAN free
+    quantized = np.full(values.shape, QUANT_NAN, dtype=np.int16)
+    quantized[finite] = np.rint((values[finite] - offset) / scale).astype(np.int16)
+
+    field_dir = os.path.join(STORE_DIR, cycle, key)
+    os.makedirs(field_dir, exist_ok=True)
+    tmp_path = os.path.join(field_dir, f"{step:02d}.tmp.npy")
+    np.save(tmp_path, quantized)
+    os.replace(tmp_path, os.path.join(field_dir, f"{step:02d}.npy"))
+
+    meta = _load_meta(cycle, key)
+    meta[f"{step:02d}"] = [scale, offset]
+    with open(_meta_path(cycle, key) + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(_meta_path(cycle, key) + ".tmp", _meta_path(cycle, key))
+
+
+def has_field(cycle, key, step):
+    return f"{step:02d}" in _load_meta(cycle, key)
+
+
+class QuantizedField:
+    """Memory-mapped int16 chunk that dequantizes only the cells it is indexed with."""
+
+    def __init__(self, quantized, scale, offset):
+        self.quantized = quantized
+        self.scale = np.float32(scale)
+        self.offset = np.float32(offset)
+        self.shape = quantized.shape
+
+    def __getitem__(self, index):
+        quantized = np.asarray(self.quantized[index])
+        values = quantized.astype(np.float32) * self.scale + self.offset
+        values[quantized == QUANT_NAN] = np.nan
+        return values
+
+
+def view_field(cycle, key, step):
+    """QuantizedField for one stored step, or None if that cycle/step was not stored."""
+    scale_offset = _load_meta(cycle, key).get(f"{step:02d}")
+    path = os.path.join(STORE_DIR, cycle, key, f"{step:02d}.npy")
+    if scale_offset is None or not os.path.exists(path):
+        return None
+    return QuantizedField(np.load(path, mmap_mode="r"), *scale_offset)
+
+
+def get_field(cycle, key, step):
+    """Dequantized float32 field, or None if that cycle/step was not stored."""
+    field = view_field(cycle, key, step)
+    return None if field is None else field[...]
+
+
+def cycle_fields(cycle):
+    """{key: [steps]} for every field stored for a cycle."""
+    fields = {}
+    cycle_dir = os.path.join(STORE_DIR, cycle)
+    for key in sorted(os.listdir(cycle_dir)) if os.path.isdir(cycle_dir) else []:
+        steps = sorted(int(step) for step in _load_meta(cycle, key))
+        if steps:
+            fields[key] = steps
+    return fields
+
+
+def put_grid(lats, lons):
+    if os.path.exists(os.path.join(STORE_DIR, "grid", "longitude.npy")):
+        return
+    try:
+        os.makedirs(os.path.join(STORE_DIR, "grid"), exist_ok=True)
+        for name, values in (("latitude", lats), ("longitude", lons)):
+            path = os.path.join(STORE_DIR, "grid", f"{name}.npy")
+            np.save(path[:-4] + ".tmp.npy", np.asarray(values, dtype=np.float32))
+            os.replace(path[:-4] + ".tmp.npy", path)
+    except OSError as e:
+        print(f"Cycle store error for the grid, continuing without it: {e}")
+
+
+def get_grid():
+    """(lats, lons) memory-mapped, or (None, None) before any script stored them."""
+    try:
+        return tuple(np.load(os.path.join(STORE_DIR, "grid", f"{name}.npy"), mmap_mode="r")
+                     for name in ("latitude", "longitude"))
+    except (OSError, ValueError):
+        return None, None
+
+
+def list_cycles():
+    if not os.path.isdir(STORE_DIR):
+        return []
+    return sorted(
+        c for c in os.listdir(STORE_DIR)
+        if c != "grid" and os.path.isdir(os.path.join(STORE_DIR, c))
+    )
+
+
+def _dir_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            total += os.path.getsize(os.path.join(root, f))
+    return total
+
+
+def evict(keep_keys=(), keep_cycles=STORE_CYCLES, max_bytes=STORE_MAX_BYTES):
+    """Trim older cycles to keep_keys, then drop the oldest ones until at most keep_cycles
+    remain and the whole store fits max_bytes. The newest cycle itself is never dropped."""
+    cycles = list_cycles()
+    for cycle in cycles[:-1]:
+        for key in os.listdir(os.path.join(STORE_DIR, cycle)):
+            if key not in keep_keys:
+                shutil.rmtree(os.path.join(STORE_DIR, cycle, key), ignore_errors=True)
+    sizes = {c: _dir_bytes(os.path.join(STORE_DIR, c)) for c in cycles}
+    while len(cycles) > 1 and (len(cycles) > keep_cycles or sum(sizes[c] for c in cycles) > max_bytes):
+        oldest = cycles.pop(0)
+        shutil.rmtree(os.path.join(STORE_DIR, oldest), ignore_errors=True)
+        print(f"Evicted cycle {oldest} from the field store ({sizes[oldest]} bytes)")
+    if cycles and sizes[cycles[-1]] > max_bytes:
+        print(f"Field store: cycle {cycles[-1]} alone is {sizes[cycles[-1]]} bytes, over HRRR_STORE_MAX_BYTES")
+
+
+def lagged_members(key, valid_time, max_lead=48, sample=None):
+    """[(cycle, field)] for every stored cycle that forecast valid_time, oldest first.
+
+    With sample (point_extract.make_sampler) each member is only the sampled points.
+    """
+    members = []
+    for cycle in list_cycles():
+        lead = (valid_time - cycle_time(cycle)) / timedelta(hours=1)
+        if 0 <= lead <= max_lead and lead == int(lead):
+            field = view_field(cycle, key, int(lead))
+            if field is not None:
+                members.append((cycle, field[...] if sample is None else sample(field)))
+    return members
+
+
+def lagged_stats(key, valid_time, sample=None):
+    """Time-lagged ensemble mean, spread and newest-minus-previous run delta.
+
+    Returns None with fewer than two members (nothing to compare yet).
+    """
+    members = lagged_members(key, valid_time, sample=sample)
+    if len(members) < 2:
+        return None
+    stack = np.stack([values for _, values in members])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN cells stay NaN
+        mean = np.nanmean(stack, axis=0)
+        spread = np.nanstd(stack, axis=0)
+    return {
+        "mean": mean,
+        "spread": spread,
+        "delta": stack[-1] - stack[-2],
+        "members": [cycle for cycle, _ in members],
+    }
@@ -0,0 +1,133 @@
+import os
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.colors import BoundaryNorm, ListedColormap
+import cartopy.crs as ccrs
+from frame_bounds import valid_window, valid_extent, crop_figsize, write_empty_frame, record_frame
+from frame_variants import write_variants
+from cycle_store import has_field, put_field, lagged_stats
+
+BASE_URL = "https://nomads.ncep.noaa.gov/cgi-bin/filter_hrrr_2d.pl"
+
+
+def build_query(inputs):
+    # One filter request for every variable and level the registered products need
+    variables = sorted({spec["var"] for spec in inputs})
+    levels = sorted({spec["level"] for spec in inputs})
+    return "".join(f"&var_{v}=on" for v in variables) + "".join(f"&lev_{l}=on" for l in levels)
+
+
+def decode_fields(file_path, inputs):
+    """Decode every needed field from one multi-level GRIB file into float32 arrays."""
+    import cfgrib
+    fields = {}
+    lats = lons = None
+    # Mixed level types need one dataset per hypercube; open_datasets splits them for us
+    for ds in cfgrib.open_datasets(file_path, backend_kwargs={"indexpath": ""}):
+        if lats is None and "latitude" in ds:
+            lats = ds["latitude"].values
+            lons = ds["longitude"].values
+        for var in ds.data_vars:
+            fields[var.lower()] = ds[var].squeeze().values.astype(np.float32)
+    # Short names cfgrib cannot resolve (e.g. lightning) fall back to a prefix match
+    for spec in inputs:
+        if spec["key"] not in fields:
+            for name in list(fields):
+                if name.startswith(spec["key"]) or (spec["key"] == "ltng" and "lightning" in name):
+                    fields[spec["key"]] = fields[name]
+                    break
+    return fields, lats, lons
+
+
+def update_history(history, fields, inputs, step):
+    # Called after the step is evaluated: keep only lagged fields later steps will still ask for
+    for spec in inputs:
+        if spec["lag"] and spec["key"] in fields:
+            per_key = history.setdefault(spec["key"], {})
+            per_key[step] = fields[spec["key"]]
+            for old_step in [s for s in per_key if s <= step - spec["lag"]]:
+                del per_key[old_step]
+
+
+def with_lagged(fields, history, inputs, step):
+    available = dict(fields)
+    for spec in inputs:
+        if spec["lag"]:
+            earlier = history.get(spec["key"], {}).get(step - spec["lag"])
+            if earlier is not None:
+                available[f"{spec['key']}@-{spec['lag']}"] = earlier
+    return available
+
+
+def store_inputs(fields, inputs, cycle, step):
+    # Quantized copy of this step's inputs (those the render scripts did not store already)
+    # for /points and for later cycles' lagged-ensemble products
+    for spec in inputs:
+        if spec["key"] in fields and not has_field(cycle, spec["key"], step):
+            put_field(cycle, spec["key"], step, fields[spec["key"]])
+
+
+def with_ensemble(fields, inputs, valid_time):
+    """Add lagged mean/spread/run-delta for ensemble inputs (call after store_inputs)."""
+    for spec in inputs:
+        if not spec["ensemble"]:
+            continue
+        stats = lagged_stats(spec["key"], valid_time)
+        if stats is not None:
+            fields[f"{spec['key']}@ens_mean"] = stats["mean"]
+            fields[f"{spec['key']}@ens_spread"] = stats["spread"]
+            fields[f"{spec['key']}@run_delta"] = stats["delta"]
+    return fields
+
+
+def _cmap_and_norm(product):
+    levels = product["levels"]
+    if isinstance(product["cmap"], str):
+        cmap = matplotlib.colormaps[product["cmap"]]
+        return cmap, BoundaryNorm(levels, cmap.N, extend=product["extend"])
+    cmap = ListedColormap(product["cmap"])
+    return cmap, BoundaryNorm(levels, cmap.N)
+
+
+def draw_product(product, values, lats, lons, png_path):
+    """Draw one frame cropped to its valid data; returns the extent, or None for an empty frame."""
+    valid = np.isfinite(values)
+    extent = valid_extent(valid, lats, lons)
+    if extent is None:
+        write_empty_frame(png_path)
+        return None
+
+    window = valid_window(valid, pad_cells=3)
+    cmap, norm = _cmap_and_norm(product)
+    fig = plt.figure(figsize=crop_figsize(extent, 10), dpi=600)
+    ax = plt.axes(projection=ccrs.PlateCarree())
+    ax.set_extent(extent, crs=ccrs.PlateCarree())
+    if product["kind"] == "categorical":
+        ax.pcolormesh(
+            lons[window], lats[window], np.ma.masked_invalid(values[window]),
+            cmap=cmap, norm=norm, shading='auto', transform=ccrs.PlateCarree()
+        )
+    else:
+        ax.contourf(
+            lons[window], lats[window], values[window],
+            levels=product["levels"], cmap=cmap, norm=norm,
+            extend=product["extend"], transform=ccrs.PlateCarree()
+        )
+    ax.set_axis_off()
+    plt.subplots_adjust(left=0, right=1, top=1, bottom=0)
+    plt.savefig(png_path, bbox_inches='tight', pad_inches=0, transparent=True)
+    plt.close(fig)
+    return extent
+
+
+def render_product(product, values, lats, lons, product_dir, step, manifest):
+    png_name = f"{product['name']}_{step:02d}.png"
+    png_path = os.path.join(product_dir, png_name)
+    extent = draw_product(product, values, lats, lons, png_path)
+    if extent is None:
+        record_frame(manifest, product_dir, step, png_name, None)
+    else:
+        record_frame(manifest, product_dir, step, png_name, extent, write_variants(png_path))
+    return png_path
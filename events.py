@@ -0,0 +1,193 @@
+import fcntl
+import json
+import os
+import queue
+import threading
+import time
+
+# Pipeline -> web notifications through an append-only JSON-lines log.
+#
+# The render scripts publish() a "step" event whenever a frame lands (from record_frame)
+# and run.py publishes a "cycle" event once a run is complete. Web workers tail the log
+# for /events, so publishing needs no broker and works across every worker process.
+# Event ids are "<inode>-<offset>": a reconnecting EventSource sends the last one back as
+# Last-Event-ID and resumes right after it; an id from a rotated-away log asks for a resync.
+#
+# A stream parks its client for STREAM_SECONDS, which only gevent workers can afford.
+# Under threaded or sync workers /events refuses streaming and clients poll since() instead.
+# Each worker tails the log once (one hub thread, a greenlet under gevent) and fans new
+# events out to its streams' queues, so idle streams cost nothing but a parked greenlet.
+EVENTS_LOG = os.path.join("Hrrr", "events.log")
+EVENTS_MAX_BYTES = int(os.environ.get("HRRR_EVENTS_MAX_BYTES", 4 * 1024 ** 2))
+
+POLL_SECONDS = 1.0
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 5000
+# Streams end after this long and the browser reconnects with Last-Event-ID, so idle
+# sockets get recycled
+STREAM_SECONDS = int(os.environ.get("HRRR_EVENTS_STREAM_SECONDS", 600))
+
+
+def publish(event_type, **data):
+    """Append one event; safe to call from several processes."""
+    os.makedirs(os.path.dirname(EVENTS_LOG), exist_ok=True)
+    line = json.dumps(dict(data, type=event_type, time=time.time())) + "\n"
+    # Every writer locks the same file (it is never rotated away) around the size check,
+    # the rotation and the append, so no event lands in a log that was just rotated
+    with open(EVENTS_LOG + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.path.getsize(EVENTS_LOG) > EVENTS_MAX_BYTES:
+                os.replace(EVENTS_LOG, EVENTS_LOG + ".1")
+        except FileNotFoundError:
+            pass
+        with open(EVENTS_LOG, "a") as f:
+            f.write(line)
+
+
+def streaming_supported():
+    # Long-lived streams are only cheap when gevent has patched the worker's sockets
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("socket")
+
+
+def _parse_id(event_id):
+    try:
+        inode, offset = event_id.split("-")
+        return int(inode), int(offset)
+    except (AttributeError, ValueError):
+        return None
+
+
+def current_position():
+    try:
+        st = os.stat(EVENTS_LOG)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size
+
+
+def read_since(position):
+    """(events, position) for every complete line after position ((inode, offset) or None)."""
+    try:
+        with open(EVENTS_LOG, "rb") as f:
+            inode = os.fstat(f.fileno()).st_ino
+            offset = position[1] if position and position[0] == inode else 0
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], position
+    events = []
+    for line in data[: data.rfind(b"\n") + 1].splitlines(keepends=True):
+        offset += len(line)
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        event["id"] = f"{inode}-{offset}"
+        events.append(event)
+    return events, (inode, offset)
+
+
+_subscribers = set()
+_hub_lock = threading.Lock()
+_hub = None
+
+
+def _hub_loop():
+    # The worker's only reader of the log; started lazily, i.e. after gunicorn forked
+    position = current_position()
+    while True:
+        time.sleep(POLL_SECONDS)
+        events, position = read_since(position)
+        if events:
+            with _hub_lock:
+                for subscriber in _subscribers:
+                    for event in events:
+                        subscriber.put(event)
+
+
+def _subscribe():
+    global _hub
+    subscriber = queue.Queue()
+    with _hub_lock:
+        if _hub is None:
+            _hub = threading.Thread(target=_hub_loop, name="events-hub", daemon=True)
+            _hub.start()
+        _subscribers.add(subscriber)
+    return subscriber
+
+
+def _unsubscribe(subscriber):
+    with _hub_lock:
+        _subscribers.discard(subscriber)
+
+
+def _format(event, decorate=None):
+    if decorate is not None:
+        event = decorate(event)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def _start(last_event_id):
+    # (position to read from, resync event or None) for a client that last saw last_event_id
+    position = _parse_id(last_event_id)
+    latest = current_position()
+    if position == (0, 0) and latest is not None:
+        return (latest[0], 0), None  # the client polled before the log existed
+    if position is None or latest is None:
+        return latest, None
+    if position[0] != latest[0] or position[1] > latest[1]:
+        # The log was rotated since the client's last event: it must refetch everything
+        return latest, {"id": f"{latest[0]}-{latest[1]}", "type": "resync"}
+    return position, None
+
+
+def since(last_event_id=None, decorate=None):
+    """(events, last_event_id) for a polling client; no id means "from now on".
+
+    Before the log exists the returned id is "0-0", which reads the log from its start.
+    """
+    position, resync = _start(last_event_id)
+    events, position = read_since(position)
+    if decorate is not None:
+        events = [decorate(event) for event in events]
+    if resync is not None:
+        events.insert(0, resync)
+    return events, f"{position[0]}-{position[1]}" if position else "0-0"
+
+
+def follow(last_event_id=None, decorate=None, duration=STREAM_SECONDS):
+    """Server-sent-event text for every event after last_event_id (or from now on)."""
+    yield f"retry: {RETRY_MS}\n\n"
+    position, resync = _start(last_event_id)
+    if resync is not None:
+        yield _format(resync)
+
+    # Subscribed before catching up, so nothing published in between is lost; the hub may
+    # then repeat events the catch-up already sent, which the position check drops
+    subscriber = _subscribe()
+    try:
+        events, position = read_since(position)
+        for event in events:
+            yield _format(event, decorate)
+
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            try:
+                event = subscriber.get(timeout=min(HEARTBEAT_SECONDS, max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                if time.monotonic() < deadline:
+                    yield ": keepalive\n\n"  # keeps proxies from closing an idle stream
+                continue
+            event_position = _parse_id(event["id"])
+            if position and event_position[0] == position[0] and event_position[1] <= position[1]:
+                continue
+            position = event_position
+            # Shared with the worker's other streams, so decorate a copy
+            yield _format(dict(event), decorate)
+    finally:
+        _unsubscribe(subscriber)
@@ -0,0 +1,204 @@
+import glob
+import os
+import shutil
+import numpy as np
+
+# Decoded fields shared between the render processes of one cycle.
+#
+# Every field is a float32 .npy file on the RAM-backed /dev/shm. Readers
+# np.load(..., mmap_mode="r") it, which maps the same physical pages into every process:
+# no re-decoding, no pickling, no per-process copy. Keys look like "<cycle>/<step>/<name>";
+# the grid geometry lives under "grid/" and is never evicted.
+#
+# Reference counting: attach() drops a "<file>.pin.<pid>" marker that release_all() removes;
+# eviction skips files pinned by a live process. Unpinned files go least-recently-used
+# first (attach touches the file's mtime) once the cache is over CACHE_MAX_BYTES.
+#
+# Only what DERIVED.py downloads itself lands here: the render scripts' fields (refc, t2m,
+# ltng, ...) are read back from the durable cycle_store instead of being copied. The cache
+# lives for one cycle (start_cycle() drops the previous one) and is sized for it from the
+# product registry. It is RAM or nothing: when /dev/shm cannot hold it (Docker gives
+# containers 64 MB by default) the cache is disabled and readers fall back to cycle_store.
+FIELD_BYTES = 1799 * 1059 * 4  # one float32 HRRR CONUS field
+STEPS_PER_CYCLE = 49
+# Left free on /dev/shm for the GRIB scratch area and everything else using it
+SHM_HEADROOM_BYTES = 512 * 1024 ** 2
+
+
+def cycle_bytes():
+    """Bytes of one cycle of every input DERIVED.py decodes itself, plus the grid."""
+    from cycle_store import SCRIPT_FIELDS
+    from products import required_inputs
+    keys = {spec["key"] for spec in required_inputs()} - set(SCRIPT_FIELDS)
+    return FIELD_BYTES * (STEPS_PER_CYCLE * len(keys) + 2)
+
+
+CACHE_MAX_BYTES = int(os.environ.get("HRRR_FIELD_CACHE_BYTES", 0)) or cycle_bytes()
+
+
+def _default_dir():
+    if not os.path.isdir("/dev/shm"):
+        return None
+    if shutil.disk_usage("/dev/shm").total < CACHE_MAX_BYTES + SHM_HEADROOM_BYTES:
+        return None
+    return "/dev/shm/hrrr_fields"
+
+
+# None: cache disabled, every lookup misses and put() is a no-op
+CACHE_DIR = os.environ.get("HRRR_FIELD_CACHE") or _default_dir()
+
+
+def field_key(cycle, step, name):
+    return f"{cycle}/{step:02d}/{name}"
+
+
+def _path(key):
+    return os.path.join(CACHE_DIR, *key.split("/")) + ".npy"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _pinned(path):
+    live = False
+    for pin in glob.glob(glob.escape(path) + ".pin.*"):
+        if _pid_alive(int(pin.rsplit(".", 1)[1])):
+            live = True
+        else:
+            try:
+                os.remove(pin)  # left behind by a crashed process
+            except FileNotFoundError:
+                pass
+    return live
+
+
+def contains(key):
+    return CACHE_DIR is not None and os.path.exists(_path(key))
+
+
+def put(key, values):
+    """Store a decoded field (as float32) and evict if the cache is over budget.
+
+    The cache is an optimization: a failure (full tmpfs, read-only disk) is logged and
+    reported as False, never raised into the render script.
+    """
+    if CACHE_DIR is None:
+        return False
+    path = _path(key)
+    tmp_path = f"{path[:-4]}.{os.getpid()}.tmp.npy"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(tmp_path, np.asarray(values, dtype=np.float32))
+        os.replace(tmp_path, path)
+        evict()
+    except OSError as e:
+        print(f"Field cache error for {key}, continuing without it: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def attach(key):
+    """Read-only zero-copy view of a cached field (pinned until release_all), or None."""
+    if CACHE_DIR is None:
+        return None
+    path = _path(key)
+    try:
+        values = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    open(f"{path}.pin.{os.getpid()}", "w").close()
+    os.utime(path)
+    return values
+
+
+def view(key):
+    """Read-only mmap of a cached field without pinning it, or None.
+
+    For short-lived readers such as web requests: if eviction unlinks the file in the
+    meantime the mapping stays valid, the pages are just freed once it is dropped.
+    """
+    if CACHE_DIR is None:
+        return None
+    try:
+        return np.load(_path(key), mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+
+
+def release_all():
+    # Drop every pin this process holds (end of a step or of the script)
+    if CACHE_DIR is None:
+        return
+    for pin in glob.glob(os.path.join(glob.escape(CACHE_DIR), "**", f"*.pin.{os.getpid()}"), recursive=True):
+        os.remove(pin)
+
+
+def put_grid(lats, lons):
+    if not contains("grid/latitude"):
+        put("grid/latitude", lats)
+        put("grid/longitude", lons)
+
+
+def attach_grid():
+    lats = attach("grid/latitude")
+    lons = attach("grid/longitude")
+    if lats is None or lons is None:
+        return None, None
+    return lats, lons
+
+
+def list_cycles():
+    # Cycle folders present in the cache, oldest first ("grid" holds the shared geometry)
+    if CACHE_DIR is None or not os.path.isdir(CACHE_DIR):
+        return []
+    return sorted(
+        c for c in os.listdir(CACHE_DIR)
+        if c != "grid" and os.path.isdir(os.path.join(CACHE_DIR, c))
+    )
+
+
+def start_cycle(cycle):
+    """Drop every other cycle's fields: the cache only ever holds the cycle being rendered."""
+    for other in list_cycles():
+        if other != cycle:
+            shutil.rmtree(os.path.join(CACHE_DIR, other), ignore_errors=True)
+
+
+def evict(max_bytes=CACHE_MAX_BYTES):
+    """Remove least-recently-used unpinned fields until the cache fits max_bytes."""
+    if CACHE_DIR is None:
+        return
+    entries = []
+    total = 0
+    for path in glob.glob(os.path.join(glob.escape(CACHE_DIR), "**", "*.npy"), recursive=True):
+        if path.endswith(".tmp.npy"):
+            continue
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        total += stat.st_size
+        if os.path.relpath(path, CACHE_DIR).startswith("grid" + os.sep):
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if _pinned(path):
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
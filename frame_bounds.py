@@ -0,0 +1,118 @@
+import json
+import math
+import os
+import shutil
+import numpy as np
+from events import publish
+
+# Full overlay extent used by every product: [west, east, south, north]
+FULL_EXTENT = [-126, -69, 24, 50]
+
+# Padding around the valid-data box so contour edges are not clipped
+BOUNDS_PAD_DEG = 0.5
+
+EMPTY_FRAME_PATH = os.path.join("Hrrr", "cache", "empty.png")
+
+
+def valid_window(valid, pad_cells=0):
+    """Row/column slices spanning the valid cells (plus pad_cells), or None if there are none."""
+    rows = np.flatnonzero(np.any(valid, axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(np.any(valid, axis=0))
+    return (
+        slice(max(rows[0] - pad_cells, 0), rows[-1] + 1 + pad_cells),
+        slice(max(cols[0] - pad_cells, 0), cols[-1] + 1 + pad_cells),
+    )
+
+
+def valid_extent(valid, lats, lons, pad=BOUNDS_PAD_DEG, clip=FULL_EXTENT):
+    """Bounding box [west, east, south, north] of the valid cells, or None if there are none.
+
+    The box is clipped to clip (the overlay extent of the region being rendered).
+    """
+    # Reduce to the row/column span first so the lat/lon min/max only touch that window
+    window = valid_window(valid)
+    if window is None:
+        return None
+    sub_valid = valid[window]
+    sub_lats = lats[window][sub_valid]
+    sub_lons = lons[window][sub_valid]
+    sub_lons = np.where(sub_lons > 180, sub_lons - 360, sub_lons)
+
+    west = max(clip[0], math.floor((sub_lons.min() - pad) * 4) / 4)
+    east = min(clip[1], math.ceil((sub_lons.max() + pad) * 4) / 4)
+    south = max(clip[2], math.floor((sub_lats.min() - pad) * 4) / 4)
+    north = min(clip[3], math.ceil((sub_lats.max() + pad) * 4) / 4)
+    if west >= east or south >= north:
+        return None  # valid cells only outside the overlay extent
+    return [west, east, south, north]
+
+
+def _mercator_y(lat):
+    return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+
+def crop_figsize(extent, full_width, projection="platecarree"):
+    """Figure size (inches) that keeps the full-extent pixel density for a cropped extent."""
+    west, east, south, north = extent
+    full_dx = FULL_EXTENT[1] - FULL_EXTENT[0]
+    width = full_width * (east - west) / full_dx
+    if projection == "mercator":
+        height = full_width * (_mercator_y(north) - _mercator_y(south)) / math.radians(full_dx)
+    else:
+        height = full_width * (north - south) / full_dx
+    return max(width, 0.5), max(height, 0.5)
+
+
+def leaflet_bounds(extent):
+    west, east, south, north = extent
+    return [[south, west], [north, east]]
+
+
+def write_empty_frame(png_path):
+    # One shared 1x1 transparent PNG; the manifest marks the frame empty so clients skip it
+    if not os.path.exists(EMPTY_FRAME_PATH):
+        from PIL import Image
+        os.makedirs(os.path.dirname(EMPTY_FRAME_PATH), exist_ok=True)
+        Image.new("RGBA", (1, 1), (0, 0, 0, 0)).save(EMPTY_FRAME_PATH)
+    shutil.copyfile(EMPTY_FRAME_PATH, png_path)
+    return png_path
+
+
+def new_manifest(product, cycle, region="conus"):
+    return {"product": product, "cycle": cycle, "region": region, "frames": {}}
+
+
+def record_frame(manifest, product_dir, step, filename, extent, variants=None):
+    """Add one frame and rewrite manifest.json; extent None marks an empty frame.
+
+    variants maps pixel width to filename for the downsampled copies (see frame_variants).
+    """
+    manifest["frames"][f"{step:02d}"] = {
+        "file": filename,
+        "empty": extent is None,
+        "bounds": leaflet_bounds(extent) if extent is not None else None,
+        "variants": {str(width): name for width, name in (variants or {}).items()},
+    }
+    path = os.path.join(product_dir, "manifest.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+    # Tell connected clients (/events) the frame is ready
+    publish(
+        "step", product=manifest["product"], cycle=manifest["cycle"],
+        region=manifest.get("region", "conus"), step=step, frame=manifest["frames"][f"{step:02d}"],
+    )
+
+
+def load_manifest(product_dir):
+    path = os.path.join(product_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {"frames": {}}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"frames": {}}
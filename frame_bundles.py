@@ -0,0 +1,66 @@
+import json
+import os
+import struct
+
+# Width of the frames packed into the per-cycle loop bundle (one of frame_variants.VARIANT_WIDTHS)
+BUNDLE_WIDTH = 1024
+
+BUNDLE_DATA = "bundle.bin"
+BUNDLE_INDEX = "bundle.json"
+
+
+def _bundle_frame_file(frame, width):
+    # Largest variant not wider than the bundle width, else the smallest one available
+    variants = {int(w): name for w, name in frame.get("variants", {}).items()}
+    if not variants:
+        return frame["file"]
+    fitting = [w for w in variants if w <= width]
+    return variants[max(fitting)] if fitting else variants[min(variants)]
+
+
+def _png_width(payload):
+    # Width field of the IHDR chunk, right after the 8-byte signature and chunk header
+    return struct.unpack(">I", payload[16:20])[0]
+
+
+def build_bundle(product_dir, manifest, url, width=BUNDLE_WIDTH):
+    """Concatenate every frame of the cycle into one file plus a JSON byte-offset index.
+
+    The data file is served with HTTP range support, so a client can either stream the
+    whole loop over one connection and slice frames as they arrive, or range-request a
+    single frame. Per-frame bounds and pixel widths are kept in the index because cropped
+    frames differ: a frame narrower than `width` (a small native image) is recorded as such.
+    """
+    frames = []
+    offset = 0
+    data_path = os.path.join(product_dir, BUNDLE_DATA)
+    tmp_path = data_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        for step in sorted(manifest["frames"], key=int):
+            frame = manifest["frames"][step]
+            entry = {"hour": int(step), "bounds": frame["bounds"], "empty": frame["empty"], "offset": offset, "length": 0, "width": 0}
+            if not frame["empty"]:
+                with open(os.path.join(product_dir, _bundle_frame_file(frame, width)), "rb") as f:
+                    payload = f.read()
+                out.write(payload)
+                entry["length"] = len(payload)
+                entry["width"] = _png_width(payload)
+                offset += len(payload)
+            frames.append(entry)
+    os.replace(tmp_path, data_path)
+
+    index = {
+        "product": manifest["product"],
+        "cycle": manifest["cycle"],
+        "url": url,
+        "width": width,
+        "size": offset,
+        "mimetype": "image/png",
+        "frames": frames,
+    }
+    index_path = os.path.join(product_dir, BUNDLE_INDEX)
+    with open(index_path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_path + ".tmp", index_path)
+    print(f"Built {manifest['product']} loop bundle: {len(frames)} frames, {offset} bytes")
+    return index_path
@@ -0,0 +1,35 @@
+import os
+from PIL import Image
+
+# Widths (px) of the downsampled copies written next to every native frame.
+# Clients pick one from the manifest based on map zoom and devicePixelRatio.
+VARIANT_WIDTHS = [1024, 2048, 4096]
+
+
+def variant_name(png_name, width):
+    stem, ext = os.path.splitext(png_name)
+    return f"{stem}_w{width}{ext}"
+
+
+def write_variants(png_path, widths=VARIANT_WIDTHS):
+    """Downsample the rendered frame into a resolution ladder; returns {width: filename}
+    including the native frame itself.
+
+    Each level is resized from the next larger one, so the native raster is decoded
+    once and nothing is re-rendered. Widths at or above the native width are skipped.
+    """
+    directory, png_name = os.path.split(png_path)
+    variants = {}
+    with Image.open(png_path) as native:
+        current = native.convert("RGBA")
+    variants[current.width] = png_name
+    for width in sorted(widths, reverse=True):
+        if width >= current.width:
+            continue
+        height = max(1, round(current.height * width / current.width))
+        current = current.resize((width, height), Image.BOX)
+        filename = variant_name(png_name, width)
+        # Palette PNG keeps the flat contour colors small; plain RGBA resamples compress worse than native
+        current.quantize(256, method=Image.FASTOCTREE).save(os.path.join(directory, filename), optimize=True)
+        variants[width] = filename
+    return dict(sorted(variants.items()))
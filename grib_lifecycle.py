@@ -0,0 +1,164 @@
+import glob
+import json
+import os
+import shutil
+from basemap_builder import BASEMAP_DIR
+from cycle_store import STORE_DIR
+from field_cache import CACHE_DIR as FIELD_CACHE_DIR
+from render_cache import RENDER_CACHE_DIR
+
+# Where downloaded GRIBs live between download and decode, and for how long.
+#
+# Every script downloads into its own folder under SCRATCH_DIR, registers the file with
+# written(), and calls done() once it has decoded it: the GRIB and cfgrib's .idx sidecars
+# are deleted right there. The decoded values already live on in field_cache / cycle_store.
+# Each script downloads and decodes one file at a time, so the scratch area never holds
+# more than one GRIB per running script and needs no budget or backpressure.
+#
+# What does grow is everything else the pipeline keeps under Hrrr/ (cycle_store, render
+# cache, static frames, basemaps, stats; each with its own cap where it has one). So every
+# download first checks that the scratch area and Hrrr/ still have MIN_FREE_BYTES free and
+# is skipped (and counted) otherwise, and the metrics report those areas' sizes.
+#
+# RAM-backed /dev/shm is used only when it is big enough (Docker's default is 64 MB and is
+# shared with anything else using it); otherwise the scratch area is on disk.
+SHM_MIN_BYTES = int(os.environ.get("HRRR_GRIB_SHM_MIN_BYTES", 256 * 1024 ** 2))
+
+
+def _default_scratch():
+    disk_dir = os.path.join("Hrrr", "cache", "grib")
+    if not os.path.isdir("/dev/shm") or shutil.disk_usage("/dev/shm").free < SHM_MIN_BYTES:
+        return disk_dir
+    return "/dev/shm/hrrr_grib"
+
+
+SCRATCH_DIR = os.environ.get("HRRR_GRIB_SCRATCH") or _default_scratch()
+MIN_FREE_BYTES = int(os.environ.get("HRRR_MIN_FREE_BYTES", 1024 ** 3))
+# Kept under Hrrr/ across the run (the field cache only when pointed at disk)
+HRRR_AREAS = {
+    "cycle_store": STORE_DIR,
+    "render_cache": RENDER_CACHE_DIR,
+    "static": os.path.join("Hrrr", "static"),
+    "basemaps": BASEMAP_DIR,
+    "stats": os.path.join("Hrrr", "stats"),
+    "field_cache": FIELD_CACHE_DIR,
+    "grib_scratch": SCRATCH_DIR,
+}
+# Keep GRIBs after decoding (debugging); they are still cleared at the start of the next run
+KEEP_GRIBS = os.environ.get("HRRR_KEEP_GRIBS") == "1"
+
+METRICS_DIR = os.path.join("Hrrr", "stats", "grib")
+
+_metrics = {
+    "bytes_written": 0,
+    "bytes_deleted": 0,
+    "index_bytes_deleted": 0,  # cfgrib .idx sidecars, not part of bytes_written
+    "files_written": 0,
+    "files_deleted": 0,
+    "peak_bytes": 0,
+    "downloads_skipped": 0,  # refused by has_room()
+}
+
+
+def scratch_dir(product):
+    """Per-product scratch folder, emptied of anything a previous (crashed) run left."""
+    path = os.path.join(SCRATCH_DIR, product)
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def scratch_bytes(path=SCRATCH_DIR):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _free_bytes(path):
+    # Free space on the file system holding path (or its nearest existing parent)
+    while path and not os.path.exists(path):
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path or ".").free
+
+
+def free_space():
+    return {"scratch": _free_bytes(SCRATCH_DIR), "hrrr": _free_bytes("Hrrr")}
+
+
+def has_room(file_name):
+    """False (and counted) when a download would eat into MIN_FREE_BYTES of scratch or Hrrr/."""
+    free = free_space()
+    if min(free.values()) >= MIN_FREE_BYTES:
+        return True
+    _metrics["downloads_skipped"] += 1
+    print(f"Skipping {file_name}: low disk space ({free}, need {MIN_FREE_BYTES} free)")
+    return False
+
+
+def written(path):
+    """Register a finished download (for the metrics); done() deletes it after decoding."""
+    _metrics["bytes_written"] += os.path.getsize(path)
+    _metrics["files_written"] += 1
+    _metrics["peak_bytes"] = max(_metrics["peak_bytes"], scratch_bytes())
+    return path
+
+
+def _remove(path):
+    # (GRIB bytes, index bytes) actually removed
+    removed = [0, 0]
+    for n, files in enumerate([[path], glob.glob(glob.escape(path) + ".*.idx")]):
+        for f in files:
+            try:
+                size = os.path.getsize(f)
+                os.remove(f)
+                removed[n] += size
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def done(path):
+    """The script has decoded path; delete the GRIB and its .idx files."""
+    if path is None or KEEP_GRIBS:
+        return
+    grib_bytes, index_bytes = _remove(path)
+    _metrics["bytes_deleted"] += grib_bytes
+    _metrics["index_bytes_deleted"] += index_bytes
+    _metrics["files_deleted"] += 1
+
+
+def save_metrics(product, cycle):
+    """Write this run's bytes-written vs retained counters to Hrrr/stats/grib/<product>.json."""
+    metrics = dict(
+        _metrics,
+        product=product,
+        cycle=cycle,
+        scratch_dir=SCRATCH_DIR,
+        bytes_retained=scratch_bytes(os.path.join(SCRATCH_DIR, product)),
+        hrrr_bytes={name: scratch_bytes(path) for name, path in HRRR_AREAS.items() if path},
+        free_bytes=free_space(),
+        min_free_bytes=MIN_FREE_BYTES,
+    )
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"{product}.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(metrics, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return metrics
+
+
+def load_metrics():
+    metrics = {}
+    for path in sorted(glob.glob(os.path.join(METRICS_DIR, "*.json"))):
+        try:
+            with open(path) as f:
+                metrics[os.path.basename(path)[:-5]] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return metrics
@@ -0,0 +1,29 @@
+import os
+
+# Serving profile, picked by environment so the same procfile works everywhere:
+#   WEB_WORKER_CLASS=gevent (default) - async workers, one greenlet per client, for many slow/idle clients
+#   WEB_WORKER_CLASS=gthread          - threaded workers, used automatically when gevent is missing
+#                                       (no long-lived /events streams there; pages poll instead)
+#   WEB_WORKER_CLASS=sync             - the old one-request-per-worker behavior
+# Compare them with bench_serving.py.
+worker_class = os.environ.get("WEB_WORKER_CLASS", "gevent")
+if worker_class == "gevent":
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        print("gevent is not installed, falling back to gthread workers")
+        worker_class = "gthread"
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+# Each worker holds its own copy of the app, its event hub and its file handles; one gevent
+# worker already serves thousands of mostly idle clients. Scale with WEB_CONCURRENCY.
+workers = int(os.environ.get("WEB_CONCURRENCY") or (1 if worker_class == "gevent" else 2))
+threads = int(os.environ.get("WEB_THREADS", 16))  # gthread only
+worker_connections = int(os.environ.get("WEB_WORKER_CONNECTIONS", 1000))  # gevent only
+
+# Large PNG responses already go out through sendfile() (gunicorn's default, unless
+# SENDFILE=0), so nothing to set for that here
+
+# Slow mobile clients downloading big frames must not be killed mid-transfer
+timeout = int(os.environ.get("WEB_TIMEOUT", 120))
+keepalive = 5
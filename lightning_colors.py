@@ -0,0 +1,35 @@
+import numpy as np
+
+# Fixed, versioned lightning color scale shared by LIGHTNING.py and colorbar_lightning.py.
+# Bump LIGHTNING_NORM_VERSION whenever the scale or colormap changes. It is recorded in each
+# cycle's lightning statistics so numbers from different scales can be told apart; no
+# cached image depends on it (frames are redrawn every cycle and the shared empty frame,
+# Hrrr/cache/empty.png, is fully transparent).
+LIGHTNING_NORM_VERSION = 1
+LIGHTNING_VMIN = 0.0
+LIGHTNING_VMAX = 20.0  # flashes per grid cell; values above saturate (colorbar extend='max')
+LIGHTNING_GAMMA = 0.5  # gamma < 1 boosts low values
+LIGHTNING_CMAP_NAME = "inferno"
+LUT_SIZE = 256
+
+
+def lightning_lut():
+    """256-entry RGBA table; index 0 is fully transparent (no flashes)."""
+    import matplotlib
+    lut = matplotlib.colormaps[LIGHTNING_CMAP_NAME](np.linspace(0, 1, LUT_SIZE))
+    lut[0] = (0, 0, 0, 0)
+    return lut
+
+
+def lightning_cmap():
+    from matplotlib.colors import ListedColormap
+    return ListedColormap(lightning_lut(), name=f"lightning_v{LIGHTNING_NORM_VERSION}")
+
+
+def lightning_indices(data):
+    """Quantize a flash field to LUT indices with the fixed PowerNorm (0 stays 0)."""
+    values = np.nan_to_num(np.asarray(data, dtype=np.float32), nan=0.0)
+    scaled = np.clip((values - LIGHTNING_VMIN) / (LIGHTNING_VMAX - LIGHTNING_VMIN), 0, 1) ** LIGHTNING_GAMMA
+    indices = np.ceil(scaled * (LUT_SIZE - 1)).astype(np.uint8)
+    indices[values <= 0] = 0
+    return indices
@@ -0,0 +1,110 @@
+import json
+import os
+import numpy as np
+
+# One JSON file per HRRR cycle, kept across runs (not inside the wiped static/lighting folder)
+STATS_DIR = os.path.join("Hrrr", "stats", "lightning")
+
+HOTSPOT_COUNT = 10
+
+
+def new_cycle_stats(cycle, region_kind, region_names):
+    return {
+        "cycle": cycle,
+        "region_kind": region_kind,
+        "regions": region_names,
+        "steps": [],
+        "_region_cumulative": np.zeros(len(region_names), dtype=np.float64),
+        "_grid_cumulative": None,
+    }
+
+
+def _top_cells(data, lats, lons, count):
+    flat = np.nan_to_num(data, nan=0.0).ravel()
+    count = min(count, flat.size)
+    idx = np.argpartition(flat, -count)[-count:]
+    idx = idx[np.argsort(flat[idx])[::-1]]
+    idx = idx[flat[idx] > 0]
+    lons_180 = np.where(lons > 180, lons - 360, lons).ravel()
+    return [
+        {"lat": round(float(lats.ravel()[i]), 4), "lon": round(float(lons_180[i]), 4), "value": float(flat[i])}
+        for i in idx
+    ]
+
+
+def _top_regions(totals, names, count):
+    order = np.argsort(totals)[::-1]
+    return [
+        {"region": names[i], "flashes": float(totals[i])}
+        for i in order[:count + 1]
+        if i != 0 and totals[i] > 0
+    ][:count]
+
+
+def add_step(stats, step, data, lats, lons, labels):
+    """Aggregate one forecast step; data is the decoded LTNG field, labels the region raster
+    (None skips the per-region totals)."""
+    values = np.nan_to_num(data, nan=0.0)
+    active = values > 0
+
+    # Vectorized per-region sums: one pass over the active cells only
+    if labels is None:
+        region_totals = np.zeros(len(stats["regions"]))
+    else:
+        region_totals = np.bincount(
+            labels[active], weights=values[active], minlength=len(stats["regions"])
+        )
+    stats["_region_cumulative"] += region_totals
+    if stats["_grid_cumulative"] is None:
+        stats["_grid_cumulative"] = np.zeros(values.shape, dtype=np.float64)
+    stats["_grid_cumulative"] += values
+
+    total = float(values.sum())
+    previous = stats["steps"][-1]["cumulative_flashes"] if stats["steps"] else 0.0
+    stats["steps"].append({
+        "step": step,
+        "total_flashes": total,
+        "cumulative_flashes": previous + total,
+        "max_cell": float(values.max()) if values.size else 0.0,
+        "active_cells": int(active.sum()),
+        "regions": {
+            stats["regions"][i]: float(region_totals[i])
+            for i in np.flatnonzero(region_totals)
+            if i != 0
+        },
+        "hotspots": _top_cells(values, lats, lons, HOTSPOT_COUNT) if total > 0 else [],
+    })
+    stats["_lats"], stats["_lons"] = lats, lons
+    return total
+
+
+def finalize(stats):
+    result = {k: v for k, v in stats.items() if not k.startswith("_")}
+    names = stats["regions"]
+    cumulative = stats["_region_cumulative"]
+    result["total_flashes"] = stats["steps"][-1]["cumulative_flashes"] if stats["steps"] else 0.0
+    result["region_totals"] = {names[i]: float(cumulative[i]) for i in np.flatnonzero(cumulative) if i != 0}
+    result["region_ranking"] = _top_regions(cumulative, names, HOTSPOT_COUNT)
+    if stats["_grid_cumulative"] is not None:
+        result["hotspots"] = _top_cells(stats["_grid_cumulative"], stats["_lats"], stats["_lons"], HOTSPOT_COUNT)
+    else:
+        result["hotspots"] = []
+    return result
+
+
+def save_stats(stats):
+    os.makedirs(STATS_DIR, exist_ok=True)
+    result = finalize(stats)
+    path = os.path.join(STATS_DIR, f"{stats['cycle']}.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(result, f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def latest_stats_path():
+    if not os.path.isdir(STATS_DIR):
+        return None
+    files = sorted(f for f in os.listdir(STATS_DIR) if f.endswith(".json"))
+    return os.path.join(STATS_DIR, files[-1]) if files else None
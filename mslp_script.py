@@ -8,9 +8,17 @@ import matplotlib.pyplot as plt
 import numpy as np
 from PIL import Image
 import cartopy.crs as ccrs  # Added import
+from frame_bounds import new_manifest, record_frame
+from frame_variants import write_variants
+from frame_bundles import build_bundle
+from cycle_store import put_field, put_grid
+from grib_lifecycle import scratch_dir, has_room, written, done, save_metrics
+from regions import REGIONS, ACTIVE_REGIONS, subregion_query, region_dir, region_grib_name, region_figsize
 
 # --- Clean up old files in grib_files and static/MSLP directories ---
-for folder in [os.path.join("Hrrr", "static", "MSLP", "grib_files"), os.path.join("Hrrr", "static", "MSLP")]:
+for folder in [os.path.join("Hrrr", "static", "MSLP", "grib_files")] + [
+    region_dir(os.path.join("Hrrr", "static", "MSLP"), r) for r in REGIONS
+]:
     if os.path.exists(folder):
         for f in os.listdir(folder):
             file_path = os.path.join(folder, f)
@@ -21,8 +29,8 @@ for folder in [os.path.join("Hrrr", "static", "MSLP", "grib_files"), os.path.joi
 base_url = "https://nomads.ncep.noaa.gov/cgi-bin/filter_hrrr_2d.pl"
 output_dir = "Hrrr"
 mslp_dir = os.path.join(output_dir, "static", "MSLP")
-grib_dir = os.path.join(mslp_dir, "grib_files")  # Now inside MSLP
-os.makedirs(grib_dir, exist_ok=True)
+# GRIBs go to the (RAM-backed when available) scratch area and are deleted once decoded
+grib_dir = scratch_dir("mslp")
 os.makedirs(mslp_dir, exist_ok=True)
 
 # Get the current UTC date and time and select the most recent HRRR run (0z, 6z, 12z, 18z)
@@ -37,20 +45,24 @@ if current_utc_time.hour < run_hour:
     run_hour = (date_for_run.hour // 6) * 6
 date_str = date_for_run.strftime("%Y%m%d")
 hour_str = str(run_hour).zfill(2)  # 00, 06, 12, 18
+cycle_id = f"{date_str}_{hour_str}z"
 variable_mslma = "MSLMA"
 
 # Function to download GRIB files (structure and time logic matches test.py)
-def download_file(hour_str, step):
+def download_file(hour_str, step, region="conus"):
     file_name = f"hrrr.t{hour_str}z.wrfsfcf{step:02d}.grib2"
-    file_path = os.path.join(grib_dir, file_name)
+    file_path = os.path.join(grib_dir, region_grib_name(file_name, region))
     url_mslp = (f"{base_url}?dir=%2Fhrrr.{date_str}%2Fconus&file={file_name}"
-                f"&var_{variable_mslma}=on&lev_mean_sea_level=on")
+                f"&var_{variable_mslma}=on&lev_mean_sea_level=on{subregion_query(region)}")
+    if not has_room(file_name):
+        return None
     response = requests.get(url_mslp, stream=True)
     if response.status_code == 200:
         with open(file_path, 'wb') as f:
             for chunk in response.iter_content(chunk_size=1024):
                 if chunk:
                     f.write(chunk)
+        written(file_path)
         file_size = os.path.getsize(file_path)
         print(f"Downloaded {file_name} ({file_size} bytes)")
         return file_path
@@ -58,7 +70,7 @@ def download_file(hour_str, step):
         print(f"Failed to download {file_name} (Status Code: {response.status_code})")
         return None
 
-def generate_png(file_path, step):
+def generate_png(file_path, step, region, out_dir, manifest):
     ds = xr.open_dataset(file_path, engine="cfgrib")
     # Check if required variables exist
     required_vars = ['mslma', 'latitude', 'longitude']
@@ -71,6 +83,10 @@ def generate_png(file_path, step):
     data = ds['mslma'].values / 100  # Convert pressure to hPa
     lats = ds['latitude'].values
     lons = ds['longitude'].values
+    if region == "conus":
+        # Durable copy of the decoded field (Pa) for /points
+        put_field(cycle_id, "mslma", step, ds['mslma'].squeeze().values)
+        put_grid(lats, lons)
 
     # Check for empty arrays or all-NaN or constant arrays
     if (
@@ -84,9 +100,10 @@ def generate_png(file_path, step):
         return None
 
     try:
-        fig = plt.figure(figsize=(10, 7), dpi=850)
+        extent = REGIONS[region]["extent"]
+        fig = plt.figure(figsize=region_figsize(region, 10), dpi=850)
         ax = plt.axes(projection=ccrs.PlateCarree())  # Use PlateCarree projection
-        ax.set_extent([-126, -69, 24, 50], crs=ccrs.PlateCarree())  # Set requested extent
+        ax.set_extent(extent, crs=ccrs.PlateCarree())  # Set requested extent
 
         # Use coolwarm colormap for contour lines
         levels = np.arange(np.floor(np.nanmin(data)), np.ceil(np.nanmax(data)) + 1, 2)
@@ -101,29 +118,42 @@ def generate_png(file_path, step):
         # Add H and L symbols for highs and lows
         min_idx = np.unravel_index(np.nanargmin(data), data.shape)
         max_idx = np.unravel_index(np.nanargmax(data), data.shape)
-        ax.text(lons[min_idx], lats[min_idx], 'L', color='blue', fontsize=24, fontweight='bold', ha='center', va='center', transform=ccrs.PlateCarree())
-        ax.text(lons[max_idx], lats[max_idx], 'H', color='red', fontsize=24, fontweight='bold', ha='center', va='center', transform=ccrs.PlateCarree())
+        # clip_on: a subregion GRIB is padded past the extent, so its extremes can sit outside the frame
+        ax.text(lons[min_idx], lats[min_idx], 'L', color='blue', fontsize=24, fontweight='bold', ha='center', va='center', transform=ccrs.PlateCarree(), clip_on=True)
+        ax.text(lons[max_idx], lats[max_idx], 'H', color='red', fontsize=24, fontweight='bold', ha='center', va='center', transform=ccrs.PlateCarree(), clip_on=True)
 
         ax.set_axis_off()
         plt.subplots_adjust(left=0, right=1, top=1, bottom=0)
-        png_path = os.path.join(mslp_dir, f"MSLP_{step:02d}.png")
+        png_path = os.path.join(out_dir, f"MSLP_{step:02d}.png")
         plt.savefig(png_path, bbox_inches='tight', pad_inches=0, transparent=True)
         plt.close(fig)
+        # Contours cover the whole domain, so the frame is published at the region's full extent
+        record_frame(manifest, out_dir, step, os.path.basename(png_path), extent, write_variants(png_path))
         print(f"Generated PNG: {png_path}")
         return png_path
     except Exception as e:
         print(f"Error generating PNG for {file_path}: {e}")
         return None
 
-# Main process: Download and plot
+# Main process: Download and plot, once per configured region (each with its own manifest)
 grib_files = []
 png_files = []
-for step in range(0, 49):
-    grib_file = download_file(hour_str, step)
-    if grib_file:
-        grib_files.append(grib_file)
-        png_file = generate_png(grib_file, step)
-        if png_file:  # Only append if PNG was generated
-            png_files.append(png_file)
+for region in ACTIVE_REGIONS:
+    out_dir = region_dir(mslp_dir, region)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = new_manifest("mslp", cycle_id, region)
+    for step in range(0, 49):
+        grib_file = download_file(hour_str, step, region)
+        if grib_file:
+            grib_files.append(grib_file)
+            png_file = generate_png(grib_file, step, region, out_dir, manifest)
+            done(grib_file)  # nothing reads the GRIB after this
+            if png_file:  # Only append if PNG was generated
+                png_files.append(png_file)
+
+    # Single-file loop bundle for streaming the whole animation; per-frame PNGs stay for deep links
+    if region == "conus" and manifest["frames"]:
+        build_bundle(out_dir, manifest, "/bundles/mslp.bin")
 
 print("All download and PNG creation tasks complete!")
+save_metrics("mslp", cycle_id)
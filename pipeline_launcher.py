@@ -0,0 +1,58 @@
+import fcntl
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# run.py inherits an flock on this file and holds it until it exits; the file also
+# records the pid for humans. No pid probing: zombies and reused pids do not matter.
+PIPELINE_LOCK = os.path.join(BASE_DIR, "Hrrr", "pipeline.lock")
+PIPELINE_LOG = os.path.join(BASE_DIR, "Hrrr", "pipeline.log")
+
+
+def _try_lock():
+    # Open lock file holding the exclusive flock, or None if a pipeline holds it
+    os.makedirs(os.path.dirname(PIPELINE_LOCK), exist_ok=True)
+    lock = open(PIPELINE_LOCK, "a+")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+
+def pipeline_running():
+    lock = _try_lock()
+    if lock is None:
+        return True
+    lock.close()  # closing drops the flock
+    return False
+
+
+def launch_pipeline(scripts=None):
+    """Start run.py as its own session, outside the web worker.
+
+    The render scripts never run inside a serving worker (no threads, no shared memory),
+    so a gunicorn worker restart or timeout cannot kill a cycle halfway. Returns the pid,
+    or None if a pipeline is already running.
+    """
+    lock = _try_lock()
+    if lock is None:
+        return None
+    command = [sys.executable, os.path.join(BASE_DIR, "run.py"), "--keep-going"] + list(scripts or [])
+    with lock, open(PIPELINE_LOG, "a") as log:
+        # The child gets its own copy of the locked descriptor, so the lock lives exactly
+        # as long as run.py does, whichever worker started it
+        process = subprocess.Popen(
+            command,
+            cwd=BASE_DIR,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            start_new_session=True,
+            pass_fds=(lock.fileno(),),
+        )
+        lock.truncate(0)
+        lock.write(str(process.pid))
+    return process.pid
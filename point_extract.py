@@ -0,0 +1,325 @@
+import csv
+import io
+import json
+import os
+from datetime import timedelta
+import numpy as np
+
+# Bulk point sampling over decoded HRRR fields and derived products.
+#
+# Points are turned into fractional grid indices once per request with the analytic HRRR
+# projection (no search over the 1.9M grid cells per point), then every field/step is a
+# single fancy-indexed gather on its memory-mapped cycle_store chunk, dequantizing only
+# the gathered cells; derived products are evaluated on those samples. Cost grows with
+# the number of fields and steps, not with a points-by-grid distance matrix.
+
+# HRRR native grid: Lambert conformal, true at 38.5N, centred on 97.5W, on the spherical
+# earth NCEP uses for it (GRIB2 shape of earth 6)
+HRRR_LCC = {"proj": "lcc", "lat_1": 38.5, "lat_2": 38.5, "lat_0": 38.5, "lon_0": -97.5, "R": 6371229}
+
+# Largest misfit (in grid cells) tolerated between the analytic grid and the GRIB lat/lon arrays
+GRID_FIT_TOLERANCE = 0.05
+
+MAX_POINTS = int(os.environ.get("HRRR_MAX_POINTS", 10000))
+
+METHODS = ("nearest", "bilinear")
+
+STEPS = range(49)
+
+FIELD_UNITS = {
+    "refc": "dBZ",
+    "t2m": "K",
+    "mslma": "Pa",
+    "ltng": "flashes/km2/5min",
+    "u10": "m/s",
+    "v10": "m/s",
+    "crain": "flag",
+    "csnow": "flag",
+    "cfrzr": "flag",
+    "cicep": "flag",
+}
+
+
+def parse_points(body, content_type):
+    """(ids, lats, lons) from a JSON or CSV request body; raises ValueError on bad input.
+
+    JSON: {"points": [{"id": "ALB", "lat": 42.75, "lon": -73.80}, ...]} or [[lat, lon], ...].
+    CSV: a header row with lat and lon columns (and optionally id).
+    """
+    if "csv" in (content_type or ""):
+        reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+        rows = [{k.strip().lower(): v for k, v in row.items() if k} for row in reader]
+    else:
+        payload = json.loads(body or b"null")
+        rows = payload.get("points") if isinstance(payload, dict) else payload
+        if not isinstance(rows, list):
+            raise ValueError("Expected a list of points")
+        rows = [dict(zip(("lat", "lon"), row)) if isinstance(row, (list, tuple)) else row for row in rows]
+    if not rows:
+        raise ValueError("No points given")
+    if len(rows) > MAX_POINTS:
+        raise ValueError(f"At most {MAX_POINTS} points per request")
+    try:
+        lats = np.array([float(row["lat"]) for row in rows])
+        lons = np.array([float(row["lon"]) for row in rows])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Every point needs numeric lat and lon")
+    ids = [str(row.get("id", i)) for i, row in enumerate(rows)]
+    return ids, lats, lons
+
+
+def _lon_180(lons):
+    return np.where(lons > 180, lons - 360, lons)
+
+
+def grid_transform(lats, lons):
+    """(x0, y0, dx, dy) mapping projected metres to (row, col), or None if pyproj is
+    missing or the lat/lon arrays are not the expected regular LCC grid."""
+    try:
+        from pyproj import Proj
+    except ImportError:
+        return None
+    proj = Proj(**HRRR_LCC)
+    ny, nx = lats.shape
+    x, y = proj(_lon_180(lons[[0, 0, -1], [0, -1, 0]]), lats[[0, 0, -1], [0, -1, 0]])
+    x0, y0 = x[0], y[0]
+    dx = (x[1] - x0) / max(nx - 1, 1)
+    dy = (y[2] - y0) / max(ny - 1, 1)
+    if dx == 0 or dy == 0:
+        return None
+    # Spot-check interior cells before trusting the analytic mapping
+    rows, cols = np.meshgrid(np.linspace(0, ny - 1, 7).astype(int), np.linspace(0, nx - 1, 7).astype(int))
+    px, py = proj(_lon_180(lons[rows, cols]), lats[rows, cols])
+    misfit = max(np.abs((px - x0) / dx - cols).max(), np.abs((py - y0) / dy - rows).max())
+    if misfit > GRID_FIT_TOLERANCE:
+        return None
+    return x0, y0, dx, dy
+
+
+def _nearest_by_distance(lats, lons, point_lats, point_lons):
+    # temp2m.py's station lookup (squared lat/lon distance argmin), for grids that do not
+    # fit the analytic projection; one pass over the grid per point
+    lons_grid = _lon_180(lons)
+    rows = np.full(point_lats.shape, np.nan)
+    cols = np.full(point_lats.shape, np.nan)
+    for i, (lat, lon) in enumerate(zip(point_lats, _lon_180(point_lons))):
+        dist = (lats - lat) ** 2 + (lons_grid - lon) ** 2
+        iy, ix = np.unravel_index(np.argmin(dist), dist.shape)
+        if dist[iy, ix] <= 0.1 ** 2:  # farther than ~3 grid cells: off the grid
+            rows[i], cols[i] = iy, ix
+    return rows, cols
+
+
+def fractional_indices(lats, lons, point_lats, point_lons):
+    """Fractional (row, col) of every point on the grid; NaN for points off the grid."""
+    transform = grid_transform(lats, lons)
+    if transform is None:
+        return _nearest_by_distance(lats, lons, point_lats, point_lons)
+    from pyproj import Proj
+    x0, y0, dx, dy = transform
+    px, py = Proj(**HRRR_LCC)(_lon_180(point_lons), point_lats)
+    rows = (np.asarray(py) - y0) / dy
+    cols = (np.asarray(px) - x0) / dx
+    ny, nx = lats.shape
+    off = ~np.isfinite(rows) | ~np.isfinite(cols) | (rows < 0) | (rows > ny - 1) | (cols < 0) | (cols > nx - 1)
+    rows[off] = np.nan
+    cols[off] = np.nan
+    return rows, cols
+
+
+def nearest_indices(lats, lons, point_lats, point_lons):
+    """Integer (row, col) of the nearest grid cell per point, -1 where a point is off the grid."""
+    rows, cols = fractional_indices(lats, lons, np.asarray(point_lats, dtype=float), np.asarray(point_lons, dtype=float))
+    off = ~np.isfinite(rows)
+    rows = np.where(off, -1, np.rint(np.nan_to_num(rows))).astype(np.intp)
+    cols = np.where(off, -1, np.rint(np.nan_to_num(cols))).astype(np.intp)
+    return rows, cols
+
+
+def make_sampler(lats, lons, point_lats, point_lons, method="nearest"):
+    """Precompute gather indices/weights; returns sample(values) -> float32 value per point."""
+    rows, cols = fractional_indices(lats, lons, point_lats, point_lons)
+    valid = np.isfinite(rows)
+    rows, cols = rows[valid], cols[valid]
+    count = point_lats.shape[0]
+
+    if method == "nearest":
+        r = np.rint(rows).astype(np.intp)
+        c = np.rint(cols).astype(np.intp)
+
+        def gather(values):
+            return values[r, c]
+    else:
+        ny, nx = lats.shape
+        r0 = np.clip(np.floor(rows).astype(np.intp), 0, max(ny - 2, 0))
+        c0 = np.clip(np.floor(cols).astype(np.intp), 0, max(nx - 2, 0))
+        fr = (rows - r0).astype(np.float32)
+        fc = (cols - c0).astype(np.float32)
+
+        def gather(values):
+            return (
+                values[r0, c0] * (1 - fr) * (1 - fc) + values[r0, c0 + 1] * (1 - fr) * fc
+                + values[r0 + 1, c0] * fr * (1 - fc) + values[r0 + 1, c0 + 1] * fr * fc
+            )
+
+    def sample(values):
+        out = np.full(count, np.nan, dtype=np.float32)
+        if values is not None and valid.any():
+            out[valid] = gather(values)
+        return out
+
+    return sample
+
+
+def _json_row(values):
+    # NaN is not JSON: missing values (off grid, masked, step not stored) become null
+    return json.dumps(np.round(values.astype(np.float64), 3).tolist()).replace("NaN", "null")
+
+
+def stream_json(meta, ids, lats, lons, steps, fields, read):
+    """Columnar JSON: fields[name]["values"][step_index][point_index]."""
+    meta = dict(meta)
+    units = meta.pop("units")
+    yield json.dumps(meta)[:-1]
+    yield ', "points": ' + json.dumps({"id": ids, "lat": lats.tolist(), "lon": lons.tolist()})
+    yield ', "steps": ' + json.dumps(steps)
+    yield ', "fields": {'
+    for n, name in enumerate(fields):
+        yield ("" if n == 0 else ", ") + json.dumps(name) + ': {"units": ' + json.dumps(units.get(name, "")) + ', "values": ['
+        for i, step in enumerate(steps):
+            yield ("" if i == 0 else ", ") + _json_row(read(name, step))
+        yield "]}"
+    yield "}}"
+
+
+def stream_csv(meta, ids, lats, lons, steps, fields, read):
+    """One row per point and step, one column per field; empty cells are missing values."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["id", "lat", "lon", "step", "valid_time"] + list(fields))
+    for step, valid_time in zip(steps, meta["valid_times"]):
+        columns = [np.round(read(name, step).astype(np.float64), 3).tolist() for name in fields]
+        for i, point_id in enumerate(ids):
+            writer.writerow(
+                [point_id, lats[i], lons[i], step, valid_time]
+                + ["" if column[i] != column[i] else column[i] for column in columns]
+            )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def stream_arrow(meta, ids, lats, lons, steps, fields, read):
+    """Arrow IPC stream, one record batch per step (needs pyarrow)."""
+    import pyarrow as pa
+    schema = pa.schema(
+        [("id", pa.string()), ("lat", pa.float64()), ("lon", pa.float64()), ("step", pa.int16())]
+        + [(name, pa.float32()) for name in fields],
+        metadata={"cycle": meta["cycle"], "method": meta["method"], "missing": json.dumps(meta["missing"])},
+    )
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for step in steps:
+            columns = [pa.array(ids), pa.array(lats), pa.array(lons), pa.array(np.full(len(ids), step, dtype=np.int16))]
+            columns += [pa.array(read(name, step), from_pandas=True) for name in fields]
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+
+FORMATS = {
+    "json": ("application/json", stream_json),
+    "csv": ("text/csv", stream_csv),
+    "arrow": ("application/vnd.apache.arrow.stream", stream_arrow),
+}
+
+
+def expected_fields(products):
+    """Every field /points serves: the scripts' fields, the products' inputs, the products."""
+    from cycle_store import SCRIPT_FIELDS
+    names = list(SCRIPT_FIELDS)
+    for product in products.values():
+        names += [spec["key"] for spec in product["inputs"]]
+    names += list(products)
+    return list(dict.fromkeys(names))
+
+
+def step_ranges(steps):
+    # [0, 1, 2, 5, 7, 8] -> "0-2,5,7-8"
+    ranges = []
+    for step in steps:
+        if ranges and ranges[-1][1] == step - 1:
+            ranges[-1][1] = step
+        else:
+            ranges.append([step, step])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def missing_fields(names, table):
+    """{name: [steps]} of every expected (field, step) pair the table has no values for."""
+    missing = {}
+    for name in names:
+        steps = [step for step in STEPS if step not in table.get(name, ())]
+        if steps:
+            missing[name] = steps
+    return missing
+
+
+def sample_cycle(cycle, cycle_start, products, lats, lons, point_lats, point_lons, method):
+    """{name: {step: values at the points}} for every stored field and every product.
+
+    Fields come from cycle_store (int16 chunks, only the gathered cells are dequantized).
+    Products are not stored: their elementwise expressions run on the sampled inputs,
+    lagged inputs and lagged-ensemble statistics, so a product costs a few thousand
+    flops per step instead of a stored grid. With bilinear sampling the inputs are
+    interpolated before the expression is applied.
+    """
+    from cycle_store import SCRIPT_FIELDS, cycle_fields, lagged_stats, view_field
+    from products import evaluate_step, required_inputs
+    sample = make_sampler(lats, lons, point_lats, point_lons, method)
+    inputs = required_inputs(products)
+    table = {}
+    for name, steps in cycle_fields(cycle).items():
+        if name in SCRIPT_FIELDS or any(spec["key"] == name for spec in inputs):
+            table[name] = {step: sample(view_field(cycle, name, step)) for step in steps}
+
+    for step in STEPS:
+        fields = {name: by_step[step] for name, by_step in table.items() if step in by_step}
+        for spec in inputs:
+            earlier = table.get(spec["key"], {}).get(step - spec["lag"]) if spec["lag"] else None
+            if earlier is not None:
+                fields[f"{spec['key']}@-{spec['lag']}"] = earlier
+            if spec["ensemble"]:
+                stats = lagged_stats(spec["key"], cycle_start + timedelta(hours=step), sample=sample)
+                if stats is not None:
+                    fields[f"{spec['key']}@ens_mean"] = stats["mean"]
+                    fields[f"{spec['key']}@ens_spread"] = stats["spread"]
+                    fields[f"{spec['key']}@run_delta"] = stats["delta"]
+        for name, values in evaluate_step(products, fields).items():
+            if values is not None:
+                table.setdefault(name, {})[step] = np.asarray(values, dtype=np.float32)
+    return table
+
+
+def extract(cycle, cycle_start, names, table, missing, ids, point_lats, point_lons, method, fmt, units):
+    """Generator of response chunks for every expected field and every step of cycle.
+
+    table is sample_cycle()'s result; pairs it lacks come out as missing values and are
+    listed under meta["missing"].
+    """
+    steps = list(STEPS)
+    nothing = np.full(len(ids), np.nan, dtype=np.float32)
+
+    def read(name, step):
+        return table.get(name, {}).get(step, nothing)
+
+    meta = {
+        "cycle": cycle,
+        "method": method,
+        "valid_times": [(cycle_start + timedelta(hours=step)).strftime("%Y-%m-%dT%H:%MZ") for step in steps],
+        "missing": missing,
+        "units": {name: units.get(name, FIELD_UNITS.get(name, "")) for name in names},
+    }
+    return FORMATS[fmt][1](meta, ids, point_lats, point_lons, steps, names, read)
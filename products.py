@@ -0,0 +1,185 @@
+import numpy as np
+
+# Declarative registry of derived products evaluated by DERIVED.py.
+#
+# Every product lists the GRIB inputs it needs (NOMADS filter variable + level, and the
+# cfgrib short name the decoded field shows up under), a vectorized NumPy expression over
+# those fields, and how to draw it. DERIVED.py downloads the union of all inputs once per
+# step, so adding a product here only adds compute, never another 49 downloads.
+#
+# Expressions get a dict of decoded float32 arrays keyed by short name. Inputs with a
+# "lag" (in forecast hours) are also available as "<key>@-<lag>" once that step exists.
+# Inputs flagged "ensemble" are kept in cycle_store across runs and add the time-lagged
+# "<key>@ens_mean", "<key>@ens_spread" and "<key>@run_delta" for the same valid time.
+# Products registered with prerender=False are skipped by DERIVED.py and only drawn on
+# request through /render/<product>/<step> (render_server.py).
+
+PRODUCTS = {}
+
+
+def register_product(name, title, inputs, expr, levels, cmap, units="", kind="contourf", extend="both", prerender=True):
+    PRODUCTS[name] = {
+        "name": name,
+        "title": title,
+        "inputs": inputs,
+        "expr": expr,
+        "levels": levels,
+        "cmap": cmap,
+        "units": units,
+        "kind": kind,  # "contourf" for continuous fields, "categorical" for class codes
+        "extend": extend,
+        "prerender": prerender,
+    }
+
+
+def kelvin_to_f(k):
+    return (k - 273.15) * 9 / 5 + 32
+
+
+T2M = {"var": "TMP", "level": "2_m_above_ground", "key": "t2m"}
+U10 = {"var": "UGRD", "level": "10_m_above_ground", "key": "u10"}
+V10 = {"var": "VGRD", "level": "10_m_above_ground", "key": "v10"}
+REFC = {"var": "REFC", "level": "entire_atmosphere", "key": "refc"}
+LTNG = {"var": "LTNG", "level": "entire_atmosphere", "key": "ltng"}
+CRAIN = {"var": "CRAIN", "level": "surface", "key": "crain"}
+CSNOW = {"var": "CSNOW", "level": "surface", "key": "csnow"}
+CFRZR = {"var": "CFRZR", "level": "surface", "key": "cfrzr"}
+CICEP = {"var": "CICEP", "level": "surface", "key": "cicep"}
+
+
+def wind_chill(f):
+    # NWS wind chill (F, mph); only defined for T <= 50F and wind > 3 mph
+    t = kelvin_to_f(f["t2m"])
+    v = np.hypot(f["u10"], f["v10"]) * 2.23694
+    v16 = np.power(np.maximum(v, 0), 0.16)
+    wc = 35.74 + 0.6215 * t - 35.75 * v16 + 0.4275 * t * v16
+    return np.where((t <= 50) & (v > 3), wc, np.nan)
+
+
+def precip_type(f):
+    # 1 rain, 2 snow, 3 freezing rain, 4 sleet; the most hazardous type wins where several are flagged
+    code = np.select(
+        [f["cfrzr"] > 0, f["cicep"] > 0, f["csnow"] > 0, f["crain"] > 0],
+        [3, 4, 2, 1],
+        default=0,
+    ).astype(np.float32)
+    return np.where(code > 0, code, np.nan)
+
+
+def temp_change_24h(f):
+    if "t2m@-24" not in f:
+        return None  # first 24 steps have no earlier field in this cycle
+    return (f["t2m"] - f["t2m@-24"]) * 9 / 5
+
+
+def t2m_ens_mean(f):
+    if "t2m@ens_mean" not in f:
+        return None  # needs at least two stored cycles covering this valid time
+    return kelvin_to_f(f["t2m@ens_mean"])
+
+
+def t2m_ens_spread(f):
+    if "t2m@ens_spread" not in f:
+        return None
+    return f["t2m@ens_spread"] * 9 / 5
+
+
+def t2m_run_delta(f):
+    if "t2m@run_delta" not in f:
+        return None
+    return f["t2m@run_delta"] * 9 / 5
+
+
+def wind_speed_10m(f):
+    return np.hypot(f["u10"], f["v10"]) * 2.23694  # m/s to mph
+
+
+def lightning_storms(f):
+    # Reflectivity only where the cell is also producing lightning
+    return np.where((f["ltng"] > 0) & (f["refc"] >= 20), f["refc"], np.nan)
+
+
+register_product(
+    "wind_chill", "Wind Chill (F)", [T2M, U10, V10], wind_chill,
+    levels=[-40, -30, -20, -10, 0, 10, 20, 30, 40, 50],
+    cmap=["#6a00a8", "#3b0f70", "#08306b", "#2171b5", "#6baed6", "#c6dbef", "#deebf7", "#f7fbff", "#ffffff"],
+    units="F", extend="min",
+)
+register_product(
+    "precip_type", "Precipitation Type", [CRAIN, CSNOW, CFRZR, CICEP], precip_type,
+    levels=[0.5, 1.5, 2.5, 3.5, 4.5],
+    cmap=["#02fd02", "#019ff4", "#fd0000", "#f800fd"],
+    kind="categorical", extend="neither",
+)
+register_product(
+    "temp_change_24h", "24h Temperature Change (F)", [dict(T2M, lag=24)], temp_change_24h,
+    levels=[-30, -20, -15, -10, -5, -2, 2, 5, 10, 15, 20, 30],
+    cmap="RdBu_r", units="F",
+)
+register_product(
+    "t2m_ens_mean", "Lagged-Ensemble Mean 2m Temp (F)", [dict(T2M, ensemble=True)], t2m_ens_mean,
+    levels=[-20, 0, 10, 20, 32, 40, 50, 60, 70, 80, 90, 100],
+    cmap=["#08306b", "#2171b5", "#6baed6", "#c6dbef", "#ffffff", "#ffffb2", "#fecc5c", "#fd8d3c", "#f03b20", "#bd0026", "#800026"],
+    units="F",
+)
+register_product(
+    "t2m_ens_spread", "Lagged-Ensemble 2m Temp Spread (F)", [dict(T2M, ensemble=True)], t2m_ens_spread,
+    levels=[0.5, 1, 2, 3, 4, 6, 8, 10],
+    cmap="YlOrRd", units="F", extend="max",
+)
+register_product(
+    "t2m_run_delta", "2m Temp Change Since Previous Run (F)", [dict(T2M, ensemble=True)], t2m_run_delta,
+    levels=[-15, -10, -6, -3, -1, 1, 3, 6, 10, 15],
+    cmap="RdBu_r", units="F",
+)
+register_product(
+    "lightning_storms", "Reflectivity With Lightning (dBZ)", [REFC, LTNG], lightning_storms,
+    levels=[20, 25, 30, 35, 40, 45, 50, 55, 60, 65, 70, 75],
+    cmap=["#02fd02", "#01c501", "#008e00", "#fdf802", "#e5bc00", "#fd9500", "#fd0000", "#d40000", "#bc0000", "#f800fd", "#9854c6"],
+    units="dBZ", extend="max",
+)
+
+register_product(
+    "wind_speed_10m", "10m Wind Speed (mph)", [U10, V10], wind_speed_10m,
+    levels=[5, 10, 15, 20, 25, 30, 40, 50, 60, 75],
+    cmap="viridis", units="mph", extend="max", prerender=False,
+)
+
+
+def evaluate_step(products, fields):
+    """Run every product expression over one step's fields; returns {name: array or None}.
+
+    Expressions are elementwise, so fields may be whole grids or values sampled at points.
+    """
+    results = {}
+    for name, product in products.items():
+        if any(spec["key"] not in fields for spec in product["inputs"]):
+            results[name] = None
+            continue
+        with np.errstate(invalid="ignore", divide="ignore"):
+            results[name] = product["expr"](fields)
+    return results
+
+
+def prerendered_products():
+    # What DERIVED.py draws for every step; the rest is rendered on demand
+    return {name: product for name, product in PRODUCTS.items() if product["prerender"]}
+
+
+def required_inputs(products=None):
+    """Union of inputs over the given products, with the largest lag asked for per field."""
+    merged = {}
+    for product in (products or PRODUCTS).values():
+        for spec in product["inputs"]:
+            current = merged.setdefault(spec["key"], dict(spec, lag=0, ensemble=False))
+            current["lag"] = max(current["lag"], spec.get("lag", 0))
+            current["ensemble"] = current["ensemble"] or spec.get("ensemble", False)
+    return list(merged.values())
+
+
+def product_listing():
+    # JSON-safe metadata (no expressions) for the app and client
+    return [
+        {k: v for k, v in product.items() if k not in ("expr", "inputs")}
+        for product in PRODUCTS.values()
+    ]
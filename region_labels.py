@@ -0,0 +1,92 @@
+import os
+import numpy as np
+
+# Cached grid-cell-to-region label rasters, kept outside the per-cycle static folders
+# so they survive the cleanup at the start of every run
+REGION_DIR = os.path.join("Hrrr", "regions")
+
+# Optional county shapefile (e.g. Census cb_*_us_county_*.shp); Natural Earth has no US counties
+COUNTY_SHAPEFILE = os.environ.get("HRRR_COUNTY_SHAPEFILE")
+
+
+def _state_records():
+    import cartopy.io.shapereader as shpreader
+    shp_path = shpreader.natural_earth(
+        resolution="50m", category="cultural", name="admin_1_states_provinces_lakes"
+    )
+    for record in shpreader.Reader(shp_path).records():
+        if record.attributes.get("admin") == "United States of America":
+            yield record.attributes["name"], record.geometry
+
+
+def _county_records():
+    import cartopy.io.shapereader as shpreader
+    if not COUNTY_SHAPEFILE or not os.path.exists(COUNTY_SHAPEFILE):
+        raise ValueError("County labels need HRRR_COUNTY_SHAPEFILE pointing to a county shapefile.")
+    for record in shpreader.Reader(COUNTY_SHAPEFILE).records():
+        attrs = record.attributes
+        name = attrs.get("NAME") or attrs.get("name")
+        state = attrs.get("STUSPS") or attrs.get("STATEFP") or ""
+        yield f"{name}, {state}" if state else name, record.geometry
+
+
+REGION_SOURCES = {
+    "state": _state_records,
+    "county": _county_records,
+}
+
+
+def _rasterize(records, lats, lons):
+    from matplotlib.path import Path
+
+    # HRRR longitudes are 0-360, shapefiles are -180 to 180
+    lons_180 = np.where(lons > 180, lons - 360, lons)
+    points = np.column_stack([lons_180.ravel(), lats.ravel()])
+    labels = np.zeros(points.shape[0], dtype=np.int32)
+    names = ["none"]  # label 0 = outside every region (ocean, Canada, Mexico)
+
+    for name, geometry in records:
+        names.append(name)
+        label = len(names) - 1
+        polygons = geometry.geoms if hasattr(geometry, "geoms") else [geometry]
+        for poly in polygons:
+            minx, miny, maxx, maxy = poly.bounds
+            # Only test unlabeled points inside the polygon's bounding box
+            candidates = np.flatnonzero(
+                (labels == 0)
+                & (points[:, 0] >= minx) & (points[:, 0] <= maxx)
+                & (points[:, 1] >= miny) & (points[:, 1] <= maxy)
+            )
+            if candidates.size == 0:
+                continue
+            inside = Path(np.asarray(poly.exterior.coords)).contains_points(points[candidates])
+            for hole in poly.interiors:
+                inside &= ~Path(np.asarray(hole.coords)).contains_points(points[candidates])
+            labels[candidates[inside]] = label
+
+    return labels.reshape(lats.shape), names
+
+
+def load_region_labels(lats, lons, kind="state"):
+    """Return (labels, names) for the grid; labels[i, j] indexes into names.
+
+    The raster is built once per grid shape and cached as .npz, so per-cycle code only
+    pays for a np.load.
+    """
+    if kind not in REGION_SOURCES:
+        raise ValueError(f"Unknown region kind '{kind}', expected one of {sorted(REGION_SOURCES)}")
+
+    cache_path = os.path.join(REGION_DIR, f"{kind}_{lats.shape[0]}x{lats.shape[1]}.npz")
+    corners = np.array([lats[0, 0], lons[0, 0], lats[-1, -1], lons[-1, -1]], dtype=np.float64)
+
+    if os.path.exists(cache_path):
+        cached = np.load(cache_path, allow_pickle=False)
+        if np.allclose(cached["corners"], corners, atol=1e-4):
+            return cached["labels"], [str(n) for n in cached["names"]]
+        print(f"Grid changed, rebuilding {cache_path}")
+
+    labels, names = _rasterize(REGION_SOURCES[kind](), lats, lons)
+    os.makedirs(REGION_DIR, exist_ok=True)
+    np.savez_compressed(cache_path, labels=labels, names=np.array(names), corners=corners)
+    print(f"Built {kind} label raster with {len(names) - 1} regions: {cache_path}")
+    return labels, names
@@ -0,0 +1,60 @@
+import os
+from frame_bounds import FULL_EXTENT, crop_figsize, leaflet_bounds
+
+# Named regions rendered by every product script: [west, east, south, north] plus how
+# much sharper than the CONUS frames they are drawn ("scale" multiplies pixel density).
+#
+# Regions with "subregion" ask filter_hrrr_2d.pl to cut the grid server-side, so the
+# GRIB, the decode, the contouring and the PNG all shrink with the box: the Northeast is
+# ~8% of the CONUS area, so even at twice the pixel density it costs about a third.
+REGIONS = {
+    "conus": {"title": "CONUS", "extent": FULL_EXTENT, "subregion": False, "scale": 1},
+    "northeast": {"title": "Northeast", "extent": [-81, -66.5, 39.5, 47.5], "subregion": True, "scale": 2},
+}
+
+# Which regions the scripts render. Every extra region adds a download and a render per
+# step to every script, so deployments opt in, e.g. HRRR_REGIONS=northeast. conus is
+# always rendered, and first: its pass stores the fields, statistics and loop bundles
+ACTIVE_REGIONS = ["conus"] + [
+    name for name in dict.fromkeys(n.strip() for n in os.environ.get("HRRR_REGIONS", "conus").split(","))
+    if name in REGIONS and name != "conus"
+]
+
+# Extra margin requested around a subregion so contours reach the frame edges
+SUBREGION_PAD_DEG = 1.0
+
+
+def subregion_query(region):
+    """filter_hrrr_2d.pl bbox parameters for a region ("" for the full grid)."""
+    spec = REGIONS[region]
+    if not spec["subregion"]:
+        return ""
+    west, east, south, north = spec["extent"]
+    pad = SUBREGION_PAD_DEG
+    return (f"&subregion=&leftlon={west - pad}&rightlon={east + pad}"
+            f"&toplat={north + pad}&bottomlat={south - pad}")
+
+
+def region_dir(product_dir, region):
+    # CONUS keeps the original layout; every other region gets a subfolder
+    return product_dir if region == "conus" else os.path.join(product_dir, region)
+
+
+def region_grib_name(file_name, region):
+    # hrrr.t12z.wrfsfcf03.grib2 -> hrrr.t12z.wrfsfcf03.northeast.grib2
+    if region == "conus":
+        return file_name
+    return file_name.replace(".grib2", f".{region}.grib2")
+
+
+def region_figsize(region, full_width, extent=None, projection="platecarree"):
+    """Figure size for a region (or a crop inside it) at the region's pixel density."""
+    spec = REGIONS[region]
+    return crop_figsize(extent or spec["extent"], full_width * spec["scale"], projection)
+
+
+def region_listing():
+    return [
+        {"name": name, "title": spec["title"], "bounds": leaflet_bounds(spec["extent"]), "active": name in ACTIVE_REGIONS}
+        for name, spec in REGIONS.items()
+    ]
@@ -0,0 +1,133 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+# On-demand frames: disk cache shared by the web workers and render_server.py, plus the
+# small client the app uses to ask the warm render workers for a missing frame.
+#
+# Layout: Hrrr/cache/render/<cycle>/<product>_<step>.png with a .json sidecar holding the
+# Leaflet bounds. A cycle's frame never changes once written, so it is served immutable.
+# Hits refresh the file's mtime; render_server evicts least-recently-used frames once the
+# cache is over RENDER_CACHE_MAX_BYTES. Nothing in here imports the plotting stack.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RENDER_CACHE_DIR = os.environ.get("HRRR_RENDER_CACHE") or os.path.join("Hrrr", "cache", "render")
+RENDER_CACHE_MAX_BYTES = int(os.environ.get("HRRR_RENDER_CACHE_BYTES", 512 * 1024 ** 2))
+
+RENDER_SOCKET = os.environ.get("HRRR_RENDER_SOCKET", os.path.join(BASE_DIR, "Hrrr", "render.sock"))
+RENDER_TIMEOUT = int(os.environ.get("HRRR_RENDER_TIMEOUT", 120))
+# How long a request waits for a render server it just started to come up
+RENDER_START_TIMEOUT = 30
+
+
+def frame_name(product, step):
+    return f"{product}_{step:02d}.png"
+
+
+def cache_paths(cycle, product, step):
+    png_path = os.path.join(RENDER_CACHE_DIR, cycle, frame_name(product, step))
+    return png_path, png_path[:-4] + ".json"
+
+
+def lookup(cycle, product, step):
+    """Cached frame info ({bounds, empty, file}) or None; a hit counts as a use for the LRU."""
+    png_path, meta_path = cache_paths(cycle, product, step)
+    try:
+        with open(meta_path) as f:
+            info = json.load(f)
+        os.utime(png_path)
+    except (OSError, ValueError):
+        return None
+    return info
+
+
+def store(cycle, product, step, tmp_png_path, bounds):
+    png_path, meta_path = cache_paths(cycle, product, step)
+    os.makedirs(os.path.dirname(png_path), exist_ok=True)
+    os.replace(tmp_png_path, png_path)
+    info = {"file": os.path.basename(png_path), "bounds": bounds, "empty": bounds is None}
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(info, f)
+    os.replace(meta_path + ".tmp", meta_path)
+    return info
+
+
+def evict(max_bytes=RENDER_CACHE_MAX_BYTES):
+    """Remove least-recently-used frames (and their sidecars) until the cache fits max_bytes."""
+    entries = []
+    total = 0
+    for root, _, files in os.walk(RENDER_CACHE_DIR):
+        for f in files:
+            if not f.endswith(".png") or f.endswith(".tmp.png"):
+                continue  # .tmp.png: another worker's frame still being drawn
+            path = os.path.join(root, f)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            total += stat.st_size
+            entries.append((stat.st_mtime, stat.st_size, path))
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        for f in (path, path[:-4] + ".json"):
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+        total -= size
+    # Drop cycle folders that eviction emptied
+    for cycle in os.listdir(RENDER_CACHE_DIR) if os.path.isdir(RENDER_CACHE_DIR) else []:
+        try:
+            os.rmdir(os.path.join(RENDER_CACHE_DIR, cycle))
+        except OSError:
+            pass
+
+
+def _ask(request, timeout):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(RENDER_SOCKET)
+        conn.sendall((json.dumps(request) + "\n").encode())
+        reply = b""
+        while not reply.endswith(b"\n"):
+            chunk = conn.recv(65536)
+            if not chunk:
+                break
+            reply += chunk
+    return json.loads(reply)
+
+
+def start_render_server():
+    # Detached like the pipeline (pipeline_launcher), so web worker restarts do not kill it.
+    # Logs next to the socket, with render_server's pid and lock files
+    log_path = os.path.join(os.path.dirname(RENDER_SOCKET), "render.log")
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(log_path, "a") as log:
+        subprocess.Popen(
+            [sys.executable, os.path.join(BASE_DIR, "render_server.py")],
+            cwd=BASE_DIR, stdout=log, stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL, start_new_session=True,
+        )
+
+
+def request_render(cycle, product, step, force=False, timeout=RENDER_TIMEOUT):
+    """Have a warm render worker draw the frame into the cache; returns its reply dict.
+
+    Starts render_server.py on first use if nothing is listening on RENDER_SOCKET.
+    """
+    request = {"cycle": cycle, "product": product, "step": step, "force": force}
+    try:
+        return _ask(request, timeout)
+    except (FileNotFoundError, ConnectionRefusedError):
+        start_render_server()
+    deadline = time.monotonic() + RENDER_START_TIMEOUT
+    while True:
+        try:
+            return _ask(request, timeout)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
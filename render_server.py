@@ -0,0 +1,219 @@
+import fcntl
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from datetime import timedelta
+
+from render_cache import RENDER_CACHE_DIR, RENDER_SOCKET, cache_paths, evict, lookup, store
+
+# Pool of pre-warmed render workers for /render/<product>/<step>.
+#
+# The parent imports the whole plotting stack (matplotlib, cartopy, the derived-product
+# engine), maps the grid geometry, builds every colormap and draws one throwaway frame,
+# then forks RENDER_WORKERS children that share all of that copy-on-write. Children
+# accept() on one Unix socket (pre-fork, like gunicorn), so a request starts drawing
+# immediately instead of paying seconds of imports. Dead children are replaced.
+#
+#   python render_server.py                      serve on RENDER_SOCKET
+#   python render_server.py --once <product> <step>   one cold render (bench_render.py)
+RENDER_WORKERS = int(os.environ.get("HRRR_RENDER_WORKERS", 2))
+RENDER_PID = os.path.join(os.path.dirname(RENDER_SOCKET), "render.pid")
+# Held (flock) for the server's lifetime: the first of several servers started at once by
+# concurrent first requests wins, the rest exit before touching the socket
+RENDER_LOCK = os.path.join(os.path.dirname(RENDER_SOCKET), "render.lock")
+
+_warm = {}
+
+
+def warm_up():
+    """Import and prime everything a render needs; cheap to call again."""
+    if _warm:
+        return _warm
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import numpy as np
+    import derived_engine
+    from products import PRODUCTS
+    from field_cache import view
+    from cycle_store import get_grid
+
+    # Colormaps/norms are rebuilt per render by derived_engine; building them once here
+    # loads the registered colormaps and catches bad product definitions at startup
+    for product in PRODUCTS.values():
+        derived_engine._cmap_and_norm(product)
+
+    lats, lons = view("grid/latitude"), view("grid/longitude")
+    if lats is None:
+        lats, lons = get_grid()
+    if lats is not None:
+        # Fault the geometry in before forking so every worker shares the same pages
+        float(lats.sum()), float(lons.sum())
+
+    # One tiny frame initializes the font cache, the projection and the PNG encoder
+    import io
+    import cartopy.crs as ccrs
+    fig = plt.figure(figsize=(1, 1), dpi=50)
+    ax = plt.axes(projection=ccrs.PlateCarree())
+    ax.contourf(np.array([[0.0, 1.0], [0.0, 1.0]]), np.array([[0.0, 0.0], [1.0, 1.0]]),
+                np.array([[0.0, 1.0], [1.0, 2.0]]), transform=ccrs.PlateCarree())
+    fig.savefig(io.BytesIO(), format="png", transparent=True)
+    plt.close(fig)
+
+    _warm.update(engine=derived_engine, products=PRODUCTS, view=view, lats=lats, lons=lons)
+    return _warm
+
+
+def gather_inputs(product, cycle, step):
+    """Fields the product's expression needs, from the field cache / cycle store, or None."""
+    from cycle_store import cycle_time, get_field, lagged_stats
+    from field_cache import field_key
+
+    def view(key, step):
+        # The field cache only holds the cycle being processed (and may be disabled);
+        # cycle_store has every input of the newest cycles
+        values = _warm["view"](field_key(cycle, step, key))
+        return get_field(cycle, key, step) if values is None else values
+
+    fields = {}
+    for spec in product["inputs"]:
+        values = view(spec["key"], step)
+        if values is None:
+            return None
+        fields[spec["key"]] = values
+        lag = spec.get("lag", 0)
+        if lag and step >= lag:
+            earlier = view(spec["key"], step - lag)
+            if earlier is not None:
+                fields[f"{spec['key']}@-{lag}"] = earlier
+        if spec.get("ensemble"):
+            stats = lagged_stats(spec["key"], cycle_time(cycle) + timedelta(hours=step))
+            if stats is not None:
+                fields[f"{spec['key']}@ens_mean"] = stats["mean"]
+                fields[f"{spec['key']}@ens_spread"] = stats["spread"]
+                fields[f"{spec['key']}@run_delta"] = stats["delta"]
+    return fields
+
+
+def render_request(request):
+    """Draw one frame into the render cache (unless cached); returns a JSON-safe reply."""
+    from frame_bounds import leaflet_bounds
+    from products import evaluate_step
+    start = time.perf_counter()
+    cycle, name, step = request["cycle"], request["product"], int(request["step"])
+    if not request.get("force"):
+        info = lookup(cycle, name, step)
+        if info is not None:
+            return dict(info, status="ok", cached=True, render_ms=0)
+
+    warm = warm_up()
+    product = warm["products"].get(name)
+    if product is None:
+        return {"status": "error", "code": 404, "error": f"Unknown product {name}"}
+    lats, lons = warm["lats"], warm["lons"]
+    if lats is None:
+        from cycle_store import get_grid
+        lats, lons = get_grid()
+        if lats is None:
+            return {"status": "error", "code": 404, "error": "No grid geometry stored yet"}
+    fields = gather_inputs(product, cycle, step)
+    if fields is None:
+        return {"status": "error", "code": 404, "error": f"Inputs for {name} step {step} are not stored"}
+    values = evaluate_step({name: product}, fields)[name]
+    if values is None:
+        return {"status": "error", "code": 404, "error": f"{name} is not defined for step {step}"}
+
+    png_path, _ = cache_paths(cycle, name, step)
+    os.makedirs(os.path.dirname(png_path), exist_ok=True)
+    tmp_path = f"{png_path[:-4]}.{os.getpid()}.tmp.png"
+    extent = warm["engine"].draw_product(product, values, lats, lons, tmp_path)
+    info = store(cycle, name, step, tmp_path, leaflet_bounds(extent) if extent is not None else None)
+    evict()
+    return dict(info, status="ok", cached=False, render_ms=round((time.perf_counter() - start) * 1000))
+
+
+def _serve(listener):
+    # The parent's shutdown handler must not run in the children
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    while True:
+        conn, _ = listener.accept()
+        with conn:
+            try:
+                request = json.loads(conn.makefile("r").readline())
+                reply = render_request(request)
+            except Exception as e:
+                reply = {"status": "error", "code": 500, "error": str(e)}
+            try:
+                conn.sendall((json.dumps(reply) + "\n").encode())
+            except OSError:
+                pass  # client gave up; the frame is cached for next time anyway
+
+
+def serve_forever(workers=RENDER_WORKERS):
+    os.makedirs(os.path.dirname(RENDER_SOCKET), exist_ok=True)
+    lock = open(RENDER_LOCK, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print(f"Render server already running for {RENDER_SOCKET}")
+        return
+    warm_start = time.perf_counter()
+    warm_up()
+    print(f"Render stack warm in {time.perf_counter() - warm_start:.2f}s, forking {workers} workers")
+
+    # Only the lock holder gets here, so a socket file left behind is stale
+    if os.path.exists(RENDER_SOCKET):
+        os.remove(RENDER_SOCKET)
+    os.makedirs(RENDER_CACHE_DIR, exist_ok=True)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(RENDER_SOCKET)
+    listener.listen(64)
+    with open(RENDER_PID, "w") as f:
+        f.write(str(os.getpid()))
+
+    children = set()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _serve(listener)
+            os._exit(0)
+        children.add(pid)
+
+    def shutdown(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for path in (RENDER_SOCKET, RENDER_PID):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for _ in range(workers):
+        spawn()
+    while True:
+        pid, status = os.wait()
+        children.discard(pid)
+        print(f"Render worker {pid} exited ({status}), starting a new one")
+        spawn()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--once":
+        from cycle_store import list_cycles
+        cycles = list_cycles()
+        if not cycles:
+            sys.exit("No cycle in the cycle store")
+        print(json.dumps(render_request({"cycle": cycles[-1], "product": sys.argv[2], "step": int(sys.argv[3]), "force": True})))
+    else:
+        serve_forever()
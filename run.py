@@ -1,6 +1,8 @@
 import subprocess
 import os
 import sys
+from datetime import datetime, timedelta
+from events import publish
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -8,10 +10,33 @@ scripts = [
     "REFC.py",
     "mslp_script.py",
     "temp2m.py",
-    "LIGHTNING.py"
+    "LIGHTNING.py",
+    "DERIVED.py",
+    "BASEMAP.py",  # no-op unless a basemap's parameters changed
 ]
+# Cosmetic stages: a failure (e.g. Natural Earth unreachable) is reported but never stops
+# the run; the previous basemaps stay in place
+OPTIONAL_SCRIPTS = {"BASEMAP.py"}
+
+# Usage: python run.py [--keep-going] [script.py ...]
+# With no scripts given, all of them run. --keep-going continues after a failing script.
+args = sys.argv[1:]
+keep_going = "--keep-going" in args
+selected = [a for a in args if a != "--keep-going"]
+if selected:
+    scripts = [s for s in selected if s in scripts]
+
+# Same cycle selection as the render scripts (most recent 0z, 6z, 12z or 18z run)
+current_utc_time = datetime.utcnow()
+run_hour = (current_utc_time.hour // 6) * 6
+date_for_run = current_utc_time
+if current_utc_time.hour < run_hour:
+    date_for_run = current_utc_time - timedelta(hours=6)
+    run_hour = (date_for_run.hour // 6) * 6
+cycle_id = f"{date_for_run.strftime('%Y%m%d')}_{str(run_hour).zfill(2)}z"
 
 # Each script runs sequentially; the next starts only after the previous finishes
+completed = []
 for script in scripts:
     script_path = os.path.join(BASE_DIR, script)
     print(f"Running {script} ...")
@@ -19,6 +44,12 @@ for script in scripts:
         result = subprocess.run([sys.executable, script_path], check=True, capture_output=True, text=True)
         print(result.stdout)
         print(f"{script} completed successfully.\n")
+        completed.append(script)
     except subprocess.CalledProcessError as e:
         print(f"Error running {script}:\n{e.stderr}\n")
-        break
+        if not keep_going and script not in OPTIONAL_SCRIPTS:
+            break
+
+# Connected clients refetch the frame lists and bundles once the whole run is in place
+if completed:
+    publish("cycle", cycle=cycle_id, scripts=completed, failed=[s for s in scripts if s not in completed])
@@ -8,13 +8,20 @@ import matplotlib.pyplot as plt
 from matplotlib.colors import LinearSegmentedColormap
 import numpy as np
 import cartopy.crs as ccrs  # Added import
+from frame_bounds import new_manifest, record_frame
+from frame_variants import write_variants
+from frame_bundles import build_bundle
+from cycle_store import put_field, put_grid
+from point_extract import nearest_indices
+from grib_lifecycle import scratch_dir, has_room, written, done, save_metrics
+from regions import REGIONS, ACTIVE_REGIONS, subregion_query, region_dir, region_grib_name, region_figsize
 import matplotlib.patheffects as path_effects
 
 # --- Clean up old files in grib_files and static/2mtemp directories ---
 for folder in [
     os.path.join("Hrrr", "static", "2mtemp", "grib_files"),  # New grib_files location
     os.path.join("Hrrr", "static", "2mtemp")
-]:
+] + [region_dir(os.path.join("Hrrr", "static", "2mtemp"), r) for r in REGIONS]:
     if os.path.exists(folder):
         for f in os.listdir(folder):
             file_path = os.path.join(folder, f)
@@ -25,8 +32,8 @@ for folder in [
 base_url = "https://nomads.ncep.noaa.gov/cgi-bin/filter_hrrr_2d.pl"
 output_dir = "Hrrr"
 temp2m_dir = os.path.join(output_dir, "static", "2mtemp")
-grib_dir = os.path.join(temp2m_dir, "grib_files")  # Now inside 2mtemp
-os.makedirs(grib_dir, exist_ok=True)
+# GRIBs go to the (RAM-backed when available) scratch area and are deleted once decoded
+grib_dir = scratch_dir("temp2m")
 os.makedirs(temp2m_dir, exist_ok=True)
 
 # Get the current UTC date and time and select the most recent HRRR run (0z, 6z, 12z, 18z)
@@ -41,6 +48,7 @@ if current_utc_time.hour < run_hour:
     run_hour = (date_for_run.hour // 6) * 6
 date_str = date_for_run.strftime("%Y%m%d")
 hour_str = str(run_hour).zfill(2)  # 00, 06, 12, 18
+cycle_id = f"{date_str}_{hour_str}z"
 
 variable_tmp = "TMP"
 
@@ -158,17 +166,20 @@ NY_ASOS_STATIONS = [
 ]
 
 # Function to download GRIB files
-def download_file(hour_str, step):
+def download_file(hour_str, step, region="conus"):
     file_name = f"hrrr.t{hour_str}z.wrfsfcf{step:02d}.grib2"
-    file_path = os.path.join(grib_dir, file_name)  # Save to new grib_dir
+    file_path = os.path.join(grib_dir, region_grib_name(file_name, region))  # Save to new grib_dir
     url_tmp = (f"{base_url}?dir=%2Fhrrr.{date_str}%2Fconus&file={file_name}"
-               f"&var_{variable_tmp}=on&lev_2_m_above_ground=on")
+               f"&var_{variable_tmp}=on&lev_2_m_above_ground=on{subregion_query(region)}")
+    if not has_room(file_name):
+        return None
     response = requests.get(url_tmp, stream=True)
     if response.status_code == 200:
         with open(file_path, 'wb') as f:
             for chunk in response.iter_content(chunk_size=1024):
                 if chunk:
                     f.write(chunk)
+        written(file_path)
         print(f"Downloaded {file_name}")
         return file_path
     else:
@@ -176,13 +187,19 @@ def download_file(hour_str, step):
         return None
 
 # Function to generate a clean PNG from GRIB file (no map features)
-def generate_clean_png(file_path, step):
+def generate_clean_png(file_path, step, region, out_dir, manifest):
     ds = xr.open_dataset(file_path, engine="cfgrib")
     data = ds['t2m'].values - 273.15  # Kelvin to Celsius
+    if region == "conus":
+        # Durable copy of the decoded field (Kelvin) for DERIVED.py, /points and the lagged ensemble
+        put_field(cycle_id, "t2m", step, ds['t2m'].squeeze().values)
+        if 'latitude' in ds and 'longitude' in ds:
+            put_grid(ds['latitude'].values, ds['longitude'].values)
 
-    fig = plt.figure(figsize=(10, 7), dpi=600)
+    extent = REGIONS[region]["extent"]
+    fig = plt.figure(figsize=region_figsize(region, 10), dpi=600)
     ax = plt.axes(projection=ccrs.PlateCarree())
-    ax.set_extent([-126, -69, 24, 50], crs=ccrs.PlateCarree())
+    ax.set_extent(extent, crs=ccrs.PlateCarree())
 
     # Get lats/lons from dataset if available, else use imshow as fallback
     if 'latitude' in ds and 'longitude' in ds:
@@ -197,13 +214,22 @@ def generate_clean_png(file_path, step):
             transform=ccrs.PlateCarree()
         )
         # Plot temperature values at NY_ASOS stations (after mesh, with high zorder)
-        for stn_id, stn_name, stn_lat, stn_lon in NY_ASOS_STATIONS:
-            # Convert station lon to 0-360 for matching grid
-            stn_lon_grid = stn_lon if stn_lon >= 0 else stn_lon + 360
+        if lats.ndim == 2 and lons.ndim == 2:
+            # One vectorized grid lookup for every station (same index math as the /points API)
+            station_rows, station_cols = nearest_indices(
+                lats, lons, [s[2] for s in NY_ASOS_STATIONS], [s[3] for s in NY_ASOS_STATIONS]
+            )
+        for n, (stn_id, stn_name, stn_lat, stn_lon) in enumerate(NY_ASOS_STATIONS):
+            # Labels outside the region would stretch the tight-cropped PNG past its bounds
+            if not (extent[0] <= stn_lon <= extent[1] and extent[2] <= stn_lat <= extent[3]):
+                continue
             if lats.ndim == 2 and lons.ndim == 2:
-                dist = (lats - stn_lat)**2 + (lons - stn_lon_grid)**2
-                iy, ix = np.unravel_index(np.argmin(dist), dist.shape)
+                iy, ix = station_rows[n], station_cols[n]
+                if iy < 0:
+                    continue  # station outside this grid
             else:
+                # Convert station lon to 0-360 for matching grid
+                stn_lon_grid = stn_lon if stn_lon >= 0 else stn_lon + 360
                 iy = np.abs(lats - stn_lat).argmin()
                 ix = np.abs(lons - stn_lon_grid).argmin()
             temp_val = data.squeeze()[iy, ix]
@@ -235,20 +261,32 @@ def generate_clean_png(file_path, step):
 
     ax.set_axis_off()
     plt.subplots_adjust(left=0, right=1, top=1, bottom=0)
-    png_path = os.path.join(temp2m_dir, f"2mtemp_{step:02d}.png")
+    png_path = os.path.join(out_dir, f"2mtemp_{step:02d}.png")
     plt.savefig(png_path, bbox_inches='tight', pad_inches=0, transparent=True, dpi=600)
     plt.close(fig)
+    # Temperature covers the whole domain, so the frame is published at the region's full extent
+    record_frame(manifest, out_dir, step, os.path.basename(png_path), extent, write_variants(png_path))
     print(f"Generated clean PNG: {png_path}")
     return png_path
 
-# Main process: Download and plot
+# Main process: Download and plot, once per configured region (each with its own manifest)
 grib_files = []
 png_files = []
-for step in range(0, 49):  # Loop through forecast steps (00 to 48 hours)
-    grib_file = download_file(hour_str, step)
-    if grib_file:
-        grib_files.append(grib_file)
-        png_file = generate_clean_png(grib_file, step)
-        png_files.append(png_file)
+for region in ACTIVE_REGIONS:
+    out_dir = region_dir(temp2m_dir, region)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = new_manifest("temp2m", cycle_id, region)
+    for step in range(0, 49):  # Loop through forecast steps (00 to 48 hours)
+        grib_file = download_file(hour_str, step, region)
+        if grib_file:
+            grib_files.append(grib_file)
+            png_file = generate_clean_png(grib_file, step, region, out_dir, manifest)
+            done(grib_file)  # nothing reads the GRIB after this
+            png_files.append(png_file)
+
+    # Single-file loop bundle for streaming the whole animation; per-frame PNGs stay for deep links
+    if region == "conus" and manifest["frames"]:
+        build_bundle(out_dir, manifest, "/bundles/temp2m.bin")
 
 print("All GRIB file download and PNG creation tasks complete!")
+save_metrics("temp2m", cycle_id)